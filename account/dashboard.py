@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from core.models import MetamaskWallet, Transaction
+from core.portfolio import portfolio_in_busd, retrieve_portfolio
+from core.registry import get_main_coin
+from core.units import SumUnits, from_units
+from ido.models import IDOParticipant
+
+from .exceptions import DashboardParamsError
+from .partners import retrieve_partners_stats
+
+
+DEFAULT_MONTHS = 3
+MAX_MONTHS = 36
+
+PARTNERS_STATS_TIMEOUT = 30
+
+
+def _partners_stats_key(user_id) -> str:
+    return f'partners_stats:{user_id}'
+
+
+def retrieve_cached_partners_stats(user) -> dict:
+    """Partners stats of user from closure table cached for a short time."""
+    key = _partners_stats_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = retrieve_partners_stats(user)
+        cache.set(key, stats, timeout=PARTNERS_STATS_TIMEOUT)
+    return stats
+
+
+def month_starts(months: int, today=None) -> list:
+    """Beginnings of next, current and `months - 1` previous months
+       in current timezone (newest first)."""
+    today = today or timezone.localdate()
+    current = today.year * 12 + today.month - 1
+    return [timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+            for index in range(current + 1, current - months, -1)]
+
+
+def retrieve_referal_income(address, coin, months: int = DEFAULT_MONTHS) -> dict:
+    """Referal income of address in coin for all time and by months
+       (current first) in one query with conditional aggregates."""
+    starts = month_starts(months)
+    aggregates = {'total': SumUnits('amount_units')}
+    for i in range(months):
+        aggregates[f'month_{i}'] = SumUnits('amount_units', filter=Q(date__gte=starts[i + 1],
+                                                                date__lt=starts[i]))
+    sums = (Transaction.objects
+            .filter(address_to=address, coin=coin, referal=True)
+            .aggregate(**aggregates))
+
+    return {'total': from_units(sums['total'] or 0, coin.decimals),
+            'by_months': [{'month': starts[i + 1].strftime('%Y-%m'),
+                           'amount': from_units(sums[f'month_{i}'] or 0,
+                                                coin.decimals)}
+                          for i in range(months)]}
+
+
+def parse_months(value) -> int:
+    if value in (None, ''):
+        return DEFAULT_MONTHS
+    try:
+        months = int(value)
+    except (TypeError, ValueError):
+        raise DashboardParamsError('Некорректное количество месяцев.')
+    if not 1 <= months <= MAX_MONTHS:
+        raise DashboardParamsError(
+            f'Количество месяцев должно быть от 1 до {MAX_MONTHS}.')
+    return months
+
+
+def retrieve_dashboard(user, months: int = DEFAULT_MONTHS) -> dict:
+    """Dashboard of user: allocations, partners stats, portfolio cost
+       and referal income for `months` trailing months."""
+    idos_allocation = (IDOParticipant.objects
+                       .filter(user=user)
+                       .aggregate(allocation=Sum('allocation'))['allocation'])
+
+    # Three last months are always returned by separate keys
+    months_count = max(months, DEFAULT_MONTHS)
+    try:
+        user_address = MetamaskWallet.objects.get(user=user).wallet_address
+        portfolio = retrieve_portfolio(user_address)
+        busd = get_main_coin()
+        referal_income = retrieve_referal_income(user_address, busd,
+                                                 months_count)
+    except Exception as e:
+        print(e)
+        portfolio = {}
+        referal_income = {'total': 0,
+                          'by_months': [{'month': start.strftime('%Y-%m'),
+                                         'amount': 0}
+                                        for start in month_starts(months_count)[1:]]}
+
+    by_months = referal_income['by_months']
+    return {
+        'invite_code': user.invite_code,
+        'can_invite': user.can_invite,
+        'partners_stats': retrieve_cached_partners_stats(user),
+        'idos_allocation': idos_allocation or 0,
+        'referal_balance': user.referal_balance,
+        'portfolio_in_busd': portfolio_in_busd(portfolio),
+        'referal_income': referal_income['total'],
+        'referal_income_current_m': by_months[0]['amount'],
+        'referal_income_pred_m': by_months[1]['amount'],
+        'referal_income_pred_2m': by_months[2]['amount'],
+        'referal_income_by_months': by_months[:months],
+    }
@@ -55,3 +55,15 @@ class RetrievePermissionsError(AccountError):
     def __init__(self, error) -> None:
         self.error = error
         super().__init__(error)
+
+
+class PaginationError(AccountError):
+    def __init__(self, error) -> None:
+        self.error = error
+        super().__init__(error)
+
+
+class DashboardParamsError(AccountError):
+    def __init__(self, error) -> None:
+        self.error = error
+        super().__init__(error)
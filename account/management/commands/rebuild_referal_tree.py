@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from account.partners import BATCH_SIZE, rebuild_referal_tree
+
+
+class Command(BaseCommand):
+    help = 'Rebuild closure table of users invite tree'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = rebuild_referal_tree(options['batch_size'])
+        print(f'Referal tree rebuilt: {count} links')
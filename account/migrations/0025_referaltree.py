@@ -0,0 +1,59 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_referal_tree(apps, schema_editor):
+    User = apps.get_model('account', 'User')
+    ReferalTree = apps.get_model('account', 'ReferalTree')
+
+    inviters = dict(User.objects.values_list('id', 'inviter_id'))
+    rows = []
+    for user_id in inviters:
+        rows.append(ReferalTree(ancestor_id=user_id,
+                                descendant_id=user_id,
+                                depth=0))
+        seen = {user_id}
+        inviter_id, depth = inviters[user_id], 1
+        while inviter_id is not None and inviter_id not in seen:
+            rows.append(ReferalTree(ancestor_id=inviter_id,
+                                    descendant_id=user_id,
+                                    depth=depth))
+            seen.add(inviter_id)
+            inviter_id, depth = inviters.get(inviter_id), depth + 1
+
+    ReferalTree.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0024_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferalTree',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='Depth (line)')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to=settings.AUTH_USER_MODEL, verbose_name='Inviter')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to=settings.AUTH_USER_MODEL, verbose_name='Partner')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='referaltree',
+            index=models.Index(fields=['ancestor', 'depth'], name='account_ref_ancesto_c0f939_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referaltree',
+            index=models.Index(fields=['descendant', 'depth'], name='account_ref_descend_2dc652_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='referaltree',
+            unique_together={('ancestor', 'descendant')},
+        ),
+        migrations.RunPython(fill_referal_tree, migrations.RunPython.noop),
+    ]
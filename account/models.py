@@ -87,51 +87,16 @@ class User(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = []
 
     @staticmethod
-    def retrieve_all_user_partners(user, partners=None, to_check=None,
-                                   active=0, passive=0, nonactive=0):
-        if not partners and not to_check:
-            partners = []
-            to_check = []
+    def retrieve_all_user_partners(user, max_depth=None):
+        from .partners import retrieve_partners
 
-        invited_users = User.objects.filter(inviter=user)
-
-
-        if invited_users or to_check:
-            if invited_users:
-                to_check.extend(invited_users)
-
-            next_user = to_check.pop()
-
-            partners.append(next_user.as_json())
-
-            if next_user.status == 'A':
-                active += 1
-            elif next_user.status == 'P':
-                passive += 1
-            else:
-                nonactive += 1
-
-            return User.retrieve_all_user_partners(next_user, partners,
-                                                   to_check, active,
-                                                   passive, nonactive)
-
-        return {'partners': partners,
-                'stats': {
-                            'active': active,
-                            'passive': passive,
-                            'nonactive': nonactive,
-                            }
-                }
+        return retrieve_partners(user, max_depth)
 
     @staticmethod
-    def get_user_inviters(user, inviters=None):
-        if inviters is None:
-            inviters = []
-        if user.inviter:
-            inviters.append(user.inviter)
-            return User.get_user_inviters(user.inviter, inviters)
-        else:
-            return inviters
+    def get_user_inviters(user, max_depth=None):
+        from .partners import retrieve_inviters
+
+        return retrieve_inviters(user, max_depth)
 
     @property
     def inviters(self):
@@ -143,6 +108,12 @@ class User(AbstractBaseUser, PermissionsMixin):
         partners = User.retrieve_all_user_partners(self)
         return partners
 
+    @property
+    def partners_stats(self):
+        from .partners import retrieve_partners_stats
+
+        return retrieve_partners_stats(self)
+
     @property
     def fio(self):
         if self.last_name:
@@ -167,6 +138,9 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     @property
     def general_ido_allocation(self):
+        # Annotated by account.partners.annotate_ido_allocation
+        if hasattr(self, 'ido_allocation'):
+            return self.ido_allocation or 0
         if self.idoparticipant_set.all():
             return sum([i.allocation for i in self.idoparticipant_set.all()])
         return 0
@@ -180,11 +154,37 @@ class User(AbstractBaseUser, PermissionsMixin):
             'telegram': self.telegram.tg_nickname if self.telegram else '',
             'balance': self.balance,
             'line': self.line,
-            'referal': self.partners,
+            'inviter': self.inviter_id,
             'ido_allocation': self.general_ido_allocation
         }
 
 
+class ReferalTree(models.Model):
+    """Closure table of invite tree.
+    Keeps row for every pair (inviter of any line, partner) with
+    distance between them (depth) and row (user, user, 0) for every user.
+    Maintained by signals (see account.signals), can be rebuilt by
+    "python3 manage.py rebuild_referal_tree".
+    """
+
+    ancestor = models.ForeignKey(User,
+                                 on_delete=models.CASCADE,
+                                 related_name='descendant_links',
+                                 verbose_name='Inviter')
+    descendant = models.ForeignKey(User,
+                                   on_delete=models.CASCADE,
+                                   related_name='ancestor_links',
+                                   verbose_name='Partner')
+    depth = models.PositiveIntegerField(verbose_name='Depth (line)')
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['ancestor', 'depth']),
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+
 class GoogleAuth(models.Model):
     """Model Google 2fa."""
 
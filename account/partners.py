@@ -0,0 +1,267 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .exceptions import InviterUserError
+from .models import ReferalTree
+from .serializers import PartnerSerializer
+from .services import paginate_queryset
+
+
+User = get_user_model()
+
+# Size of batches for bulk inserts and streaming reads
+BATCH_SIZE = 2000
+
+PAGE_SIZE = 50
+
+STATUSES_STATS = {'A': 'active', 'P': 'passive', 'N': 'nonactive'}
+
+
+def _links_lookup(prefix: str, max_depth: int = None) -> dict:
+    # All conditions on multi-valued relation must be in one filter() call,
+    # otherwise each call adds its own join.
+    lookup = {f'{prefix}__depth__gte': 1}
+    if max_depth is not None:
+        lookup[f'{prefix}__depth__lte'] = max_depth
+    return lookup
+
+
+def _partners_queryset(user, max_depth: int = None):
+    partners = User.objects.filter(ancestor_links__ancestor=user,
+                                   **_links_lookup('ancestor_links', max_depth))
+    return partners.annotate(depth=F('ancestor_links__depth'))
+
+
+def iter_partners(user, max_depth: int = None, batch_size: int = BATCH_SIZE):
+    """Stream all user partners (invited users of all lines).
+       Yields (depth, partner) ordered by line, one query for whole tree."""
+    partners = (_partners_queryset(user, max_depth)
+                .select_related('telegram')
+                .order_by('depth', 'id'))
+    for partner in partners.iterator(chunk_size=batch_size):
+        yield partner.depth, partner
+
+
+def iter_partners_statuses(user, max_depth: int = None,
+                           batch_size: int = BATCH_SIZE):
+    """Stream (depth, partner_id, status) without building model objects."""
+    partners = (_partners_queryset(user, max_depth)
+                .order_by('depth', 'id')
+                .values_list('depth', 'id', 'status'))
+    yield from partners.iterator(chunk_size=batch_size)
+
+
+def empty_stats() -> dict:
+    return {key: 0 for key in STATUSES_STATS.values()}
+
+
+def count_status(stats: dict, status: str, count: int = 1):
+    stats[STATUSES_STATS.get(status, 'nonactive')] += count
+
+
+def retrieve_partners_stats(user, max_depth: int = None) -> dict:
+    """Count active/passive/nonactive partners of user in one query."""
+    stats = empty_stats()
+    counts = (_partners_queryset(user, max_depth)
+              .order_by()
+              .values_list('status')
+              .annotate(count=Count('id')))
+    for status, count in counts:
+        count_status(stats, status, count)
+    return stats
+
+
+def retrieve_users_partners_stats(users) -> dict:
+    """Partners stats for many users (list or queryset) in one query.
+       Returns {user_id: stats}."""
+    result = defaultdict(empty_stats)
+    counts = (ReferalTree.objects
+              .filter(ancestor__in=users, depth__gte=1)
+              .order_by()
+              .values_list('ancestor_id', 'descendant__status')
+              .annotate(count=Count('id')))
+    for user_id, status, count in counts:
+        count_status(result[user_id], status, count)
+    return result
+
+
+def annotate_ido_allocation(users):
+    """Annotate users queryset with sum of their IDOs allocations."""
+    return users.annotate(ido_allocation=Coalesce(
+                                Sum('idoparticipant__allocation'),
+                                Value(0.0)))
+
+
+def _partners_for_json(user, max_depth: int = None):
+    return annotate_ido_allocation(_partners_queryset(user, max_depth)
+                                   .select_related('telegram'))
+
+
+def retrieve_partners(user, max_depth: int = None, fields=None) -> dict:
+    """Collect all user partners (flat list) and their statuses stats."""
+    partners = _partners_for_json(user, max_depth).order_by('depth', 'id')
+
+    return {'partners': PartnerSerializer(partners, many=True,
+                                          fields=fields).data,
+            'stats': retrieve_partners_stats(user, max_depth)}
+
+
+def retrieve_partners_page(user, max_depth: int = None, fields=None,
+                           cursor: str = None, limit: int = PAGE_SIZE) -> dict:
+    """Page of user partners ordered by id, starting after `cursor`
+       (next_cursor of previous page)."""
+    page = paginate_queryset(_partners_for_json(user, max_depth), ('id',),
+                             limit, cursor, with_count=False)
+
+    return {'partners': PartnerSerializer(page['items'], many=True,
+                                          fields=fields).data,
+            'stats': retrieve_partners_stats(user, max_depth),
+            'next_cursor': page['next_cursor']}
+
+
+def retrieve_users_partners(users, max_depth: int = 1, fields=None) -> dict:
+    """Partners (up to `max_depth` line) of many users in one query.
+       Returns {user_id: [partner, ...]}."""
+    partners = annotate_ido_allocation(
+                    User.objects
+                    .filter(ancestor_links__ancestor__in=users,
+                            ancestor_links__depth__gte=1,
+                            ancestor_links__depth__lte=max_depth)
+                    .annotate(depth=F('ancestor_links__depth'),
+                              partner_of=F('ancestor_links__ancestor_id'))
+                    .select_related('telegram')
+               ).order_by('partner_of', 'depth', 'id')
+    partners = list(partners)
+    data = PartnerSerializer(partners, many=True, fields=fields).data
+
+    result = defaultdict(list)
+    for partner, partner_data in zip(partners, data):
+        result[partner.partner_of].append(partner_data)
+    return result
+
+
+def retrieve_inviters(user, max_depth: int = None) -> list:
+    """All inviters of user from the nearest one (first line) to the root."""
+    inviters = User.objects.filter(descendant_links__descendant=user,
+                                   **_links_lookup('descendant_links',
+                                                   max_depth))
+    return list(inviters.order_by('descendant_links__depth'))
+
+
+def build_referal_tree_rows(users_inviters):
+    """Help generator to build closure rows from (user_id, inviter_id) pairs.
+       Yields (ancestor_id, descendant_id, depth)."""
+    children = defaultdict(list)
+    roots = []
+    for user_id, inviter_id in users_inviters:
+        if inviter_id is None:
+            roots.append(user_id)
+        else:
+            children[inviter_id].append(user_id)
+
+    ancestors = {}
+    to_check = list(roots)
+    for root in roots:
+        ancestors[root] = ()
+
+    while to_check:
+        user_id = to_check.pop()
+        yield user_id, user_id, 0
+        for depth, ancestor_id in enumerate(ancestors[user_id], start=1):
+            yield ancestor_id, user_id, depth
+
+        user_ancestors = (user_id,) + ancestors.pop(user_id)
+        for child_id in children.pop(user_id, ()):
+            ancestors[child_id] = user_ancestors
+            to_check.append(child_id)
+
+
+def _bulk_create_links(rows, batch_size: int = BATCH_SIZE):
+    batch = []
+    for ancestor_id, descendant_id, depth in rows:
+        batch.append(ReferalTree(ancestor_id=ancestor_id,
+                                 descendant_id=descendant_id,
+                                 depth=depth))
+        if len(batch) >= batch_size:
+            ReferalTree.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        ReferalTree.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def rebuild_referal_tree(batch_size: int = BATCH_SIZE) -> int:
+    """Rebuild whole closure table from User.inviter. Returns count of rows."""
+    users_inviters = list(User.objects.values_list('id', 'inviter_id'))
+    with transaction.atomic():
+        ReferalTree.objects.all().delete()
+        _bulk_create_links(build_referal_tree_rows(users_inviters),
+                           batch_size)
+        return ReferalTree.objects.count()
+
+
+def attach_partner(user):
+    """Add links of just registered user to all his inviters."""
+    rows = [(user.pk, user.pk, 0)]
+    if user.inviter_id:
+        inviter_links = (ReferalTree.objects
+                         .filter(descendant_id=user.inviter_id)
+                         .values_list('ancestor_id', 'depth'))
+        rows.extend((ancestor_id, user.pk, depth + 1)
+                    for ancestor_id, depth in inviter_links)
+    _bulk_create_links(rows)
+
+
+def check_inviter(user, inviter_id):
+    """Inviter of user can't be user himself or one of his partners."""
+    if user.pk and inviter_id and ReferalTree.objects.filter(
+                                        ancestor_id=user.pk,
+                                        descendant_id=inviter_id).exists():
+        raise InviterUserError(
+            'Пользователь не может быть приглашен своим партнером.')
+
+
+def detach_partner(user):
+    """Remove links between user (with his partners) and his inviters."""
+    subtree = ReferalTree.objects.filter(ancestor_id=user.pk).values('descendant_id')
+    (ReferalTree.objects
+     .filter(descendant_id__in=subtree)
+     .exclude(ancestor_id__in=subtree)
+     .delete())
+
+
+def move_partner(user):
+    """Relink user with all his partners to his current inviter."""
+    with transaction.atomic():
+        detach_partner(user)
+        if not ReferalTree.objects.filter(ancestor_id=user.pk,
+                                          descendant_id=user.pk).exists():
+            attach_partner(user)
+            return
+
+        if not user.inviter_id:
+            return
+
+        subtree = list(ReferalTree.objects
+                       .filter(ancestor_id=user.pk)
+                       .values_list('descendant_id', 'depth'))
+        inviter_links = list(ReferalTree.objects
+                             .filter(descendant_id=user.inviter_id)
+                             .values_list('ancestor_id', 'depth'))
+        _bulk_create_links(
+            (ancestor_id, descendant_id, ancestor_depth + depth + 1)
+            for ancestor_id, ancestor_depth in inviter_links
+            for descendant_id, depth in subtree
+        )
+
+
+def has_inviter_changed(user) -> bool:
+    """Compare inviter of user with his first line link in closure table."""
+    linked = (ReferalTree.objects
+              .filter(descendant_id=user.pk, depth=1)
+              .values_list('ancestor_id', flat=True)
+              .first())
+    return linked != user.inviter_id
@@ -22,6 +22,45 @@ class UserSerializer(serializers.ModelSerializer):
                    'permanent_place', 'last_login', 'is_staff')
 
 
+class PartnerSerializer(serializers.ModelSerializer):
+    """Flat serializer for user partner (without nested partners).
+    Expects `depth` and `ido_allocation` annotations (see account.partners).
+    Optional `fields` argument limits fields of result."""
+
+    fio = serializers.CharField(read_only=True)
+    status = serializers.CharField(source='full_status', read_only=True)
+    telegram = serializers.SerializerMethodField()
+    depth = serializers.IntegerField(read_only=True)
+    ido_allocation = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('id', 'email', 'fio', 'status', 'telegram', 'balance',
+                  'line', 'inviter', 'depth', 'ido_allocation')
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_telegram(self, user):
+        return user.telegram.tg_nickname if user.telegram else ''
+
+
+class PartnersQuerySerializer(serializers.Serializer):
+    """Serializer for options of partners list."""
+
+    depth = serializers.IntegerField(required=False, min_value=1)
+    fields = serializers.ListField(
+                        child=serializers.ChoiceField(
+                            choices=PartnerSerializer.Meta.fields),
+                        required=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(required=False, default=50,
+                                     min_value=1, max_value=500)
+
+
 class ResetPasswordTokenSerializer(serializers.Serializer):
     """Serializer for checking token during change endpoint."""
 
@@ -1,22 +1,35 @@
 ﻿import base64
+import binascii
 import io
+import json
 from datetime import datetime as dt, timezone
 from random import randint
 from math import ceil
 from typing import Tuple
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.mail import send_mail
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, OuterRef, Q, Subquery
 import pyotp
 from qrcode import QRCode, constants
 
+from core.models import MetamaskWallet, Transaction
 from .models import TgCode
-from .exceptions import RetrievePermissionsError
+from .exceptions import PaginationError, RetrievePermissionsError
 from config.settings import EMAIL_HOST_USER
 
 
 User = get_user_model()
 
+PAGE_COUNT_TIMEOUT = 60
+
+PERMISSIONS_DB = ("ido", "transaction", "user", "news", 'statistics')
+
+# Codenames of permissions which are returned by retrieve_permissions
+PERMISSIONS_CODENAMES_REGEX = rf'^[a-z]+_({"|".join(PERMISSIONS_DB)})(_|$)'
+
 
 def generate_code(tg_account):
     """Help function for generating code that is sended to Telegram."""
@@ -87,12 +100,11 @@ def verify_google_code(token, code):
 
 def retrieve_permissions(user):
     """Help function to retrieve user permissions."""
-    permissions_db = ("ido", "transaction", "user", "news", 'statistics')
     try:
         permissions = set()
         for perm in user.user_permissions.all():
             name = perm.codename.split('_')[1]
-            if name in permissions_db:
+            if name in PERMISSIONS_DB:
                 permissions.add(name)
 
         if user.is_staff or user.is_superuser:
@@ -122,3 +134,123 @@ def paginate(items: list, objects_on_page: int, current_page: int) -> Tuple[list
         return (items[(current_page-1)*objects_on_page:current_page*objects_on_page],
                count_pages,
                current_page)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps microseconds of datetimes (DjangoJSONEncoder cuts them),
+       otherwise cursor doesn't match its item."""
+
+    def default(self, o):
+        if isinstance(o, dt):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values: list) -> str:
+    """Opaque cursor from values of ordering fields of last item on page."""
+    data = json.dumps(values, cls=CursorEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise PaginationError('Некорректный курсор страницы.')
+    if not isinstance(values, list) or len(values) != size:
+        raise PaginationError('Некорректный курсор страницы.')
+    return values
+
+
+def _keyset_condition(ordering: tuple, values: list) -> Q:
+    """Condition of items which follow item with `values` in `ordering`."""
+    condition = Q()
+    for index, field in enumerate(ordering):
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        item_condition = Q(**{f'{field.lstrip("-")}__{lookup}': values[index]})
+        for prev_field, value in zip(ordering[:index], values):
+            item_condition &= Q(**{prev_field.lstrip('-'): value})
+        condition |= item_condition
+    return condition
+
+
+def _item_value(item, field: str):
+    name = field.lstrip('-')
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+
+def count_items(queryset, count_key: str = None) -> int:
+    """Count of queryset items, cached by `count_key` for a short time."""
+    if count_key is None:
+        return queryset.count()
+    return cache.get_or_set(f'page_count:{count_key}', queryset.count,
+                            timeout=PAGE_COUNT_TIMEOUT)
+
+
+def paginate_queryset(queryset, ordering: tuple, limit: int,
+                      cursor: str = None, page: int = None,
+                      count_key: str = None, with_count: bool = True) -> dict:
+    """Keyset pagination of queryset.
+       `ordering` - fields of model (not relations), the last one must be
+       unique (e.g. 'id'). Next page starts after `cursor` (next_cursor of
+       previous page), `page` number is supported for old clients.
+       Returns {'items', 'next_cursor', 'count_pages', 'current_page'}."""
+    queryset = queryset.order_by(*ordering)
+    page_items = queryset
+    current_page = None
+    if cursor:
+        page_items = queryset.filter(
+                        _keyset_condition(ordering,
+                                          decode_cursor(cursor, len(ordering))))
+    else:
+        current_page = max(page or 1, 1)
+        offset = (current_page - 1) * limit
+        page_items = queryset[offset:]
+
+    items = list(page_items[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([_item_value(items[-1], field)
+                                     for field in ordering])
+
+    count_pages = None
+    if with_count:
+        count_pages = max(ceil(count_items(queryset, count_key) / limit), 1)
+
+    return {'items': items,
+            'next_cursor': next_cursor,
+            'count_pages': count_pages,
+            'current_page': current_page}
+
+
+def retrieve_page_params(request) -> tuple:
+    """Cursor and page number from request body or query string."""
+    cursor = request.data.get('cursor') or request.query_params.get('cursor')
+    page = request.data.get('page') or request.query_params.get('page') or 1
+    try:
+        page = int(page)
+    except (TypeError, ValueError):
+        raise PaginationError('Некорректный номер страницы.')
+    return cursor, page
+
+
+def retrieve_referal_charges(address):
+    """Referal transactions to address with coin name and email of
+       sender (owner of metamask wallet) in one query."""
+    sender_email = (MetamaskWallet.objects
+                    .filter(wallet_address=OuterRef('address_from'))
+                    .values('user__email')[:1])
+    return (Transaction.objects
+            .filter(address_to=address, referal=True)
+            .values('id', 'date', 'amount')
+            .annotate(coin_name=F('coin__name'),
+                      sender_email=Subquery(sender_email)))
+
+
+def serialize_referal_charge(charge: dict) -> dict:
+    date = charge['date']
+    return {'date': f'{date.day}.{date.month}.{date.year}',
+            'coin': charge['coin_name'],
+            'amount': charge['amount'],
+            'from': charge['sender_email']}
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_init, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from .partners import (attach_partner, check_inviter, detach_partner,
+                       has_inviter_changed, move_partner)
+
+
+User = get_user_model()
+
+# Inviter is unknown if field was deferred during loading of user
+UNKNOWN = object()
+
+# Sent after inviters of user (and of all his partners) were changed
+inviters_changed = Signal()
+
+
+@receiver(post_init, sender=User)
+def remember_inviter(sender, instance, **kwargs):
+    instance._saved_inviter_id = instance.__dict__.get('inviter_id', UNKNOWN)
+
+
+def _inviter_changed(instance, update_fields) -> bool:
+    if update_fields is not None and 'inviter' not in update_fields \
+            and 'inviter_id' not in update_fields:
+        return False
+    saved_inviter_id = getattr(instance, '_saved_inviter_id', UNKNOWN)
+    if saved_inviter_id is UNKNOWN:
+        return has_inviter_changed(instance)
+    return saved_inviter_id != instance.inviter_id
+
+
+@receiver(pre_save, sender=User)
+def validate_inviter(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and instance.inviter_id \
+            and _inviter_changed(instance, update_fields):
+        check_inviter(instance, instance.inviter_id)
+
+
+@receiver(post_save, sender=User)
+def update_referal_tree(sender, instance, created, update_fields=None,
+                        raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        attach_partner(instance)
+    elif _inviter_changed(instance, update_fields):
+        move_partner(instance)
+        inviters_changed.send(sender=sender, user=instance)
+    instance._saved_inviter_id = instance.inviter_id
+
+
+@receiver(pre_delete, sender=User)
+def remove_from_referal_tree(sender, instance, **kwargs):
+    detach_partner(instance)
+    inviters_changed.send(sender=sender, user=instance)
@@ -1,4 +1,3 @@
-import datetime
 from math import ceil
 
 from django.contrib.auth import get_user_model
@@ -12,25 +11,30 @@ from rest_framework.status import (HTTP_400_BAD_REQUEST,
 from knox.models import AuthToken
 import pyotp
 
-from core.models import MetamaskWallet, Transaction
+from core.models import MetamaskWallet
+from core.portfolio import retrieve_portfolio
 from ido.serializers import PureIDOSerializer
 
 from .exceptions import (LoginUserError, EmailValidationError,
                          TgAccountVerifyError, InviterUserError,
                          UserWithTgExistsError, UserDoesNotExists,
-                         TokenDoesNotExists, RetrievePermissionsError)
+                         TokenDoesNotExists, RetrievePermissionsError,
+                         PaginationError, DashboardParamsError)
+from .dashboard import parse_months, retrieve_dashboard
 from .models import TgAccount, TgCode, GoogleAuth
 from .serializers import (RegisterUserSerializer, LoginUserSerializer,
                           TgAccountSerializer, TgAccountCodeSerializer,
                           EmailSerializer, ChangePasswordSerializer,
                           ResetPasswordTokenSerializer, GoogleCodeSerializer,
-                          UserSerializer)
+                          UserSerializer, PartnersQuerySerializer)
+from .partners import retrieve_partners_page
 from .services import (generate_code, check_code_time, paginate,
+                       paginate_queryset, retrieve_page_params,
+                       retrieve_referal_charges, serialize_referal_charge,
                        verify_google_code, send_mail_message,
                        generate_google_qrcode, retrieve_permissions)
 from administrator.services import retrieve_users_info
 from ido.models import IDOParticipant
-from core.models import Coin
 
 
 User = get_user_model()
@@ -372,12 +376,23 @@ class RetrieveUserPartnersView(GenericAPIView):
     """API endpoint to retrieve info about user partners."""
 
     permission_classes = (IsAuthenticated,)
-    serializer_class = UserSerializer
+    serializer_class = PartnersQuerySerializer
 
     def get(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
         try:
-            user = User.objects.get(email=request.user)
-            data = retrieve_users_info([user])
+            users = User.objects.filter(email=request.user)
+            data = retrieve_users_info(users, max_depth=0)
+            for user in users:
+                data[user.email]['referal'] = retrieve_partners_page(
+                                                user,
+                                                options.get('depth'),
+                                                options.get('fields'),
+                                                options.get('cursor'),
+                                                options['limit'])
             return Response({'users': data}, status=HTTP_200_OK)
 
         except Exception as e:
@@ -391,78 +406,13 @@ class DashboardView(GenericAPIView):
 
     def get(self, request):
         user = User.objects.get(email=request.user)
-        idos = IDOParticipant.objects.filter(user=user)
-        if idos:
-            idos_allocation = sum([ido.allocation for ido in idos if ido.allocation])
-        else:
-            idos_allocation = 0
-
         try:
-            metamask = MetamaskWallet.objects.get(user=user)
-            user_address = metamask.wallet_address
-            busd, _ = Coin.objects.get_or_create(name='BUSD')
-            transactions = Transaction.objects.filter(address_to=user_address,
-                                                      coin=busd,
-                                                      referal=True)
-            if transactions:
-                referal_income = sum(trans.amount for trans in transactions if trans.amount)
-            else:
-                referal_income = 0
-
-            current_year = datetime.date.today().year
-            query_month_pred_2 = datetime.date.today().month - 2
-            if query_month_pred_2 == -1:
-                query_month_pred_2 = 11
-                query_year_pred_2 = current_year - 1
-                query_month_pred_1 = 12
-                query_year_pred_1 = current_year - 1
-            if query_month_pred_2 == 0:
-                query_month_pred_2 = 12
-                query_year_pred_2 = current_year - 1
-                query_month_pred_1 = 1
-                query_year_pred_1 = current_year
-            else:
-                query_year_pred_2 = current_year
-                query_month_pred_1 = query_month_pred_2 + 1
-                query_year_pred_1 = current_year
-
-            transactions_m_2 = Transaction.objects.filter(address_to=user_address,
-                                                          coin=busd,
-                                                          referal=True,
-                                                          date__month=query_month_pred_2,
-                                                          date__year=query_year_pred_2)
-            transactions_m_1 = Transaction.objects.filter(address_to=user_address,
-                                                          coin=busd,
-                                                          referal=True,
-                                                          date__month=query_month_pred_1,
-                                                          date__year=query_year_pred_1)
-            transactions_m = Transaction.objects.filter(address_to=user_address,
-                                                          coin=busd,
-                                                          referal=True,
-                                                          date__month=datetime.date.today().month,
-                                                          date__year=datetime.date.today().year)
-            referal_income_pred_2m = sum(trans.amount for trans in transactions_m_2 if trans.amount)
-            referal_income_pred_m = sum(trans.amount for trans in transactions_m_1 if trans.amount)
-            referal_income_current_m = sum(trans.amount for trans in transactions_m if trans.amount)
+            months = parse_months(request.data.get('months')
+                                  or request.query_params.get('months'))
+        except DashboardParamsError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        except Exception as e:
-            print(e)
-            referal_income = 0
-            referal_income_pred_2m = 0
-            referal_income_pred_m = 0
-            referal_income_current_m = 0
-
-        result = {}
-
-        result['invite_code'] = user.invite_code
-        result['can_invite'] = user.can_invite
-        result['partners_stats'] = user.partners['stats']
-        result['idos_allocation'] = idos_allocation
-        result['referal_balance'] = user.referal_balance
-        result['referal_income'] = referal_income
-        result['referal_income_current_m'] = referal_income_current_m
-        result['referal_income_pred_m'] = referal_income_pred_m
-        result['referal_income_pred_2m'] = referal_income_pred_2m
+        result = retrieve_dashboard(user, months)
 
         if not result:
             return Response({"error": "Ошибка получения информации о пользователе."},
@@ -483,13 +433,10 @@ class DashboardReferalChargesView(GenericAPIView):
         try:
             metamask = MetamaskWallet.objects.get(user=user)
             user_address = metamask.wallet_address
-            transactions = Transaction.objects.filter(address_to=user_address,
-                                                      referal=True).order_by('date')
-            if transactions:
-                for trans in transactions:
-                    transacts.append({'coin': trans.coin.name,
-                                 'date': f'{trans.date.day}.{trans.date.month}.{trans.date.year}'
-                    })
+            charges = retrieve_referal_charges(user_address).order_by('date', 'id')
+            for charge in charges:
+                charge = serialize_referal_charge(charge)
+                transacts.append({'coin': charge['coin'], 'date': charge['date']})
 
         except Exception as e:
             print(e)
@@ -512,28 +459,23 @@ class UserIDOsView(GenericAPIView):
                 "error": 'У пользователя нет прав на просмотр IDO.'
                 }, status=HTTP_403_FORBIDDEN)
 
-        result = []
-
         try:
-            idos = IDOParticipant.objects.filter(user=user)
-            if idos:
-                for ido in idos:
-                    ido_info = PureIDOSerializer(ido.ido)
-                    result.append({'ido_info': ido_info.data,
-                                  'user_allocation': ido.allocation})
-
-        except Exception as e:
-            print(e)
-            return Response({"error": "Ошибка получения информации об IDO пользователя."},
-                            status=HTTP_400_BAD_REQUEST)
+            cursor, page_number = retrieve_page_params(request)
+            page = paginate_queryset(
+                        IDOParticipant.objects.filter(user=user).select_related('ido'),
+                        ('id',), 3, cursor, page_number,
+                        count_key=f'user_idos:{user.pk}')
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        result, count_pages, current_page = paginate(result,
-                                                     3,
-                                                     int(request.data.get('page', 1)))
+        result = [{'ido_info': PureIDOSerializer(ido.ido).data,
+                   'user_allocation': ido.allocation}
+                  for ido in page['items']]
 
         return Response({'user_idos': result,
-                         'count_pages': count_pages,
-                         'current_page': current_page})
+                         'count_pages': page['count_pages'],
+                         'current_page': page['current_page'],
+                         'next_cursor': page['next_cursor']})
 
 
 class UserIDOsStatsView(GenericAPIView):
@@ -555,37 +497,23 @@ class UserIDOsStatsView(GenericAPIView):
                      status=HTTP_400_BAD_REQUEST)
         result = []
         try:
-            idos = IDOParticipant.objects.filter(user=user)
-            if idos:
-                for ido_part in idos:
-                    coin = ido_part.ido.coin
-                    smart = ido_part.ido.smartcontract
-
-                    refund = ido_part.refund_allocation
-                    ts = Transaction.objects.filter(address_to=user_address,
-                                                    coin=coin)
-                    if ts:
-                        if ts.filter(received=True):
-                            received = sum(t.amount for t in ts.filter(received=True,
-                                                                       visible=True))
-                        else:
-                            received = 0
-                        if ts.filter(received=False):
-                            available = sum(t.amount for t in ts.filter(received=False,
-                                                                        visible=True))
-                        else:
-                            available = 0
-                    else:
-                        received = 0
-                        available = 0
-
-                    result.append({
-                        'coin': coin.name,
-                        'smartcontract': smart.address if smart else '',
-                        'received': received,
-                        'refund_allocation': refund,
-                        'available': available
-                    })
+            idos = (IDOParticipant.objects
+                    .filter(user=user)
+                    .select_related('ido__coin', 'ido__smartcontract'))
+            portfolio = retrieve_portfolio(user_address,
+                                           [ido_part.ido.coin for ido_part in idos])
+            for ido_part in idos:
+                coin = ido_part.ido.coin
+                smart = ido_part.ido.smartcontract
+                position = portfolio[coin.pk]
+
+                result.append({
+                    'coin': coin.name,
+                    'smartcontract': smart.address if smart else '',
+                    'received': position['received'],
+                    'refund_allocation': ido_part.refund_allocation,
+                    'available': position['available']
+                })
 
         except Exception as e:
             print(e)
@@ -682,25 +610,17 @@ class ReferalChargesView(GenericAPIView):
             Response({"error": "У пользователя не привязан кошелек Metamask."},
                      status=HTTP_400_BAD_REQUEST)
 
-        result = []
-        transactions = Transaction.objects.filter(address_to=user_address,
-                                                  referal=True)
-        if transactions:
-            for ts in transactions:
-                wallet_from = MetamaskWallet.objects.get(wallet_address=ts.address_from) 
-                result.append({
-                    'date': f'{ts.date.day}.{ts.date.month}.{ts.date.year}',
-                    'coin': ts.coin.name,
-                    'amount': ts.amount,
-                    'from': wallet_from.user.email,
-                })
+        try:
+            cursor, page_number = retrieve_page_params(request)
+            page = paginate_queryset(retrieve_referal_charges(user_address),
+                                     ('date', 'id'), 1, cursor, page_number,
+                                     count_key=f'referal_charges:{user.pk}')
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        result, count_pages, current_page = paginate(
-                                                result,
-                                                1,
-                                                int(request.data.get('page', 1))
-                                            )
+        result = [serialize_referal_charge(charge) for charge in page['items']]
 
         return Response({'referal_charges': result,
-                         'count_pages': count_pages,
-                         'current_page': current_page})
+                         'count_pages': page['count_pages'],
+                         'current_page': page['current_page'],
+                         'next_cursor': page['next_cursor']})
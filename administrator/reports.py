@@ -0,0 +1,95 @@
+from collections import Counter
+from datetime import date, timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth
+
+from core.models import TransactionRollup, TransactionRollupDelta
+from core.rollup import CATEGORIES as ROLLUP_CATEGORIES
+
+from .exceptions import IncorrectDateError
+
+
+PERIODS = {'day': TruncDay, 'month': TruncMonth}
+
+CATEGORIES = tuple(ROLLUP_CATEGORIES)
+
+
+def day_start(day, month, year) -> date:
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        raise IncorrectDateError('Такой даты не существует.')
+
+
+def _rollup(coin, date_from: date, date_to: date, categories) -> list:
+    """Querysets of rollup rows and of deltas not folded yet."""
+    return [model.objects.filter(coin=coin,
+                                 category__in=categories,
+                                 day__gte=date_from,
+                                 day__lt=date_to)
+            for model in (TransactionRollup, TransactionRollupDelta)]
+
+
+def retrieve_report(coin, date_from: date, date_to: date,
+                    categories=CATEGORIES) -> dict:
+    """Sums of transactions amounts by categories for days
+       [date_from, date_to) from daily rollup."""
+    report = dict.fromkeys(categories, 0)
+    for rows in _rollup(coin, date_from, date_to, categories):
+        sums = (rows
+                .order_by()
+                .values_list('category')
+                .annotate(amount=Sum('amount')))
+        for category, amount in sums:
+            report[category] += amount
+    return report
+
+
+def retrieve_grouped_report(coin, date_from: date, date_to: date,
+                            period: str = 'day', categories=CATEGORIES) -> dict:
+    """Sums of transactions amounts by categories for every day (or month)
+       of days [date_from, date_to) from daily rollup.
+       Returns {'YYYY-MM-DD': {category: amount}}, periods without
+       transactions are missing."""
+    report, counts = {}, Counter()
+    for rows in _rollup(coin, date_from, date_to, categories):
+        sums = (rows
+                .annotate(period=PERIODS[period]('day'))
+                .order_by('period')
+                .values_list('period', 'category')
+                .annotate(amount=Sum('amount'), count=Sum('count')))
+        for period_start, category, amount, count in sums:
+            key = period_start.isoformat()
+            amounts = report.setdefault(key, dict.fromkeys(categories, 0))
+            amounts[category] += amount
+            counts[key] += count
+    # Deltas may take off all transactions of period
+    return {key: amounts for key, amounts in sorted(report.items())
+            if counts[key]}
+
+
+def retrieve_day_report(coin, day, month, year) -> dict:
+    date_from = day_start(day, month, year)
+    return retrieve_report(coin, date_from, date_from + timedelta(days=1))
+
+
+def retrieve_range_report(coin, date_from: date, date_to: date) -> dict:
+    """Report for days from date_from to date_to (including both)
+       with totals and sums by days."""
+    by_days = retrieve_grouped_report(coin, date_from,
+                                      date_to + timedelta(days=1))
+    report = {category: sum(amounts[category] for amounts in by_days.values())
+              for category in CATEGORIES}
+    report['by_days'] = by_days
+    return report
+
+
+def retrieve_months_report(coin, year: int, categories=('akv_income',)) -> dict:
+    """Sums of transactions by months of year: {month number: {category: amount}}."""
+    by_months = retrieve_grouped_report(coin, date(year, 1, 1),
+                                        date(year + 1, 1, 1),
+                                        period='month', categories=categories)
+    return {month: by_months.get(date(year, month, 1).isoformat(),
+                                 dict.fromkeys(categories, 0))
+            for month in range(1, 13)}
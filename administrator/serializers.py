@@ -10,6 +10,7 @@ from account.exceptions import (EmailValidationError, LoginUserError,
                                 UserDoesNotExists)
 from account.serializers import EmailSerializer
 from administrator.exceptions import IncorrectDateError
+from ido.exceptions import QueueError
 
 User = get_user_model()
 
@@ -97,6 +98,41 @@ class UserPrioritySerializer(EmailSerializer):
     number = serializers.IntegerField(required=False)
 
 
+class UsersPrioritiesSerializer(serializers.Serializer):
+    """Serializer for setting queue numbers of many users."""
+
+    places = serializers.ListField(
+                        child=serializers.DictField(),
+                        required=True,
+                        allow_empty=False,
+                        error_messages={
+                            'empty': "Список мест не может быть пустым.",
+                            'required': "Поле со списком мест отсутствует.",
+                            })
+
+    def validate(self, attrs):
+        places = []
+        for place in attrs['places']:
+            try:
+                validate_email(place.get('email'))
+            except ValidationError:
+                raise EmailValidationError('Введите корректный почтовый ящик.')
+            number = place.get('number')
+            if number is not None and (not isinstance(number, int)
+                                       or isinstance(number, bool)):
+                raise QueueError('Номер в очереди должен быть целым числом.')
+            places.append((place['email'], number))
+
+        users = User.objects.in_bulk([email for email, _ in places],
+                                     field_name='email')
+        for email, _ in places:
+            if email not in users:
+                raise UserDoesNotExists(
+                    f"Пользователя {email} не существует."
+                    )
+        return [(users[email], number) for email, number in places]
+
+
 class AdminCustomTokenWalletSerializer(serializers.Serializer):
     """Serializer for creating admin wallet with custom tokens."""
 
@@ -110,10 +146,16 @@ class AdminCustomTokenWalletSerializer(serializers.Serializer):
                         error_messages={
                             'blank': "Адрес не может быть пустым."
                             })
-    decimal = serializers.FloatField(
+    # Amounts keep 50 decimal places
+    decimal = serializers.IntegerField(
                         required=True,
+                        min_value=0,
+                        max_value=50,
                         error_messages={
-                            'blank': "Множитель не может быть пустым."
+                            'blank': "Множитель не может быть пустым.",
+                            'invalid': "Множитель должен быть целым числом.",
+                            'min_value': "Множитель не может быть отрицательным.",
+                            'max_value': "Множитель не может быть больше 50."
                             })
 
 
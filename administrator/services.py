@@ -1,8 +1,15 @@
-﻿from django.contrib.auth.models import Permission
+﻿from collections import defaultdict
+
+from django.contrib.auth.models import Permission
 from django.contrib.auth import get_user_model
-from django.db.models import Max
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
 
 from .exceptions import GrantPermissionsError
+from account.partners import (annotate_ido_allocation,
+                              retrieve_users_partners,
+                              retrieve_users_partners_stats)
 from ido.models import QueueUser, IDOParticipant
 
 
@@ -44,73 +51,67 @@ def grant_permissions(user, perms):
         raise GrantPermissionsError("Ошибка предоставления прав пользователю.")
 
 
-def refresh_queue_places(user):
-    """Help function to refresh all queues places
-       during set him place by admin"""
-    queues = QueueUser.objects.filter(user=user)
-    if queues:
-        for queue in queues:
-            if not user.permanent_place:
-                if queue.permanent and queue.is_active:
-                    queue.permanent = False
-                    ido = queue.ido
-
-                    # Up all lower users with early date and permanent
-                    low_queues = QueueUser.objects.filter(
-                                    ido=ido,
-                                    number__gt=queue.number)
-                    for q in low_queues:
-                        if q.permanent or q.date < queue.date:
-                            q.number -= 1
-                            q.save()
-
-                    # Calculating new number
-                    low_queues_ = QueueUser.objects.filter(
-                                    ido=ido,
-                                    permanent=False,
-                                    date__gte=queue.date).order_by('number')
-                    if low_queues_:
-                        new_number = low_queues_[0].number - 1
-                        queue.number = new_number
-                    else:
-                        all_queues = QueueUser.objects.filter(ido=ido)
-                        if len(all_queues) > 1:
-                            new_number = all_queues.aggregate(Max('number'))
-                            queue.number = new_number['number__max'] + 1
-
-                    queue.save()
-            else:
-                if not queue.permanent and queue.is_active:
-                    queue.permanent = True
-                    queue.number = user.permanent_place
-                    ido = queue.ido
-
-                    # Down all lower users
-                    low_queues = QueueUser.objects.filter(
-                                    ido=ido,
-                                    number__gte=user.permanent_place)
-
-                    for q in low_queues:
-                        if q == user:
-                            break
-                        q.number += 1
-                        q.save()
-
-                    queue.save()
-
-
-def retrieve_users_info(users: list, data: dict = {}):
-    for user in users:
+def retrieve_users_info(users, max_depth: int = 1, fields=None) -> dict:
+    """Help function to retrieve users info with flat lists of their
+       partners (up to `max_depth` line) and partners stats."""
+    if max_depth:
+        users_partners = retrieve_users_partners(users, max_depth, fields)
+    else:
+        users_partners = defaultdict(list)
+    users_stats = retrieve_users_partners_stats(users)
+
+    data = {}
+    for user in annotate_ido_allocation(users.select_related('telegram')):
         user_data = {}
         user_data['line'] = user.line
         user_data['fio'] = user.fio
         user_data['status'] = user.full_status
-        user_data['referal'] = user.partners
-
-        idos = IDOParticipant.objects.filter(user=user)
-        summ = sum([ido.allocation for ido in idos if ido.allocation])
-
-        user_data['ido'] = summ if summ else 0
+        user_data['referal'] = {'partners': users_partners[user.pk],
+                                'stats': users_stats[user.pk]}
+        user_data['ido'] = user.ido_allocation
 
         data[user.email] = user_data
     return data
+
+
+ADMIN_STATS_KEY = 'admin_stats'
+ADMIN_STATS_TIMEOUT = 30
+
+# Users with balance from this value are in pool
+POOL_BALANCE = 651
+POOL_ALLOCATION = 650
+
+
+def count_admin_stats() -> dict:
+    """Platform statistics by aggregate query per table."""
+    investment = (IDOParticipant.objects
+                  .aggregate(investment=Sum('allocation'))['investment'])
+    users = User.objects.aggregate(
+                count_users=Count('id'),
+                count_users_pool=Count('id', filter=Q(balance__gte=POOL_BALANCE)),
+                balance=Sum('balance'),
+                referal_balance=Sum('referal_balance'))
+    users_in_queues = (QueueUser.objects
+                       .aggregate(count=Count('user', distinct=True))['count'])
+
+    reserve = users['balance'] or 0
+    return {'investment': investment or 0,
+            'count_users': users['count_users'],
+            'pool': users['count_users_pool'] * POOL_ALLOCATION,
+            'users_in_queues': users_in_queues,
+            'balance': reserve + (users['referal_balance'] or 0),
+            'reserve': reserve}
+
+
+def retrieve_admin_stats() -> dict:
+    """Platform statistics cached for a short time."""
+    stats = cache.get(ADMIN_STATS_KEY)
+    if stats is None:
+        stats = count_admin_stats()
+        cache.set(ADMIN_STATS_KEY, stats, timeout=ADMIN_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_admin_stats():
+    """Drop cached statistics after commit of current changes."""
+    transaction.on_commit(lambda: cache.delete(ADMIN_STATS_KEY))
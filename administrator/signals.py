@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ido.models import IDOParticipant, QueueUser
+
+from .services import invalidate_admin_stats
+
+
+User = get_user_model()
+
+
+# Balances fields of users, their F() updates invalidate statistics
+# in core.balances
+STATS_FIELDS = {'balance', 'referal_balance'}
+
+
+@receiver(post_save, sender=User)
+def drop_admin_stats_user(sender, created, update_fields=None, **kwargs):
+    # Full save may change balances, saves of other fields don't
+    if created or update_fields is None or STATS_FIELDS & set(update_fields):
+        invalidate_admin_stats()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=IDOParticipant)
+@receiver(post_delete, sender=IDOParticipant)
+@receiver(post_save, sender=QueueUser)
+@receiver(post_delete, sender=QueueUser)
+def drop_admin_stats(sender, **kwargs):
+    invalidate_admin_stats()
@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from .services import ADMIN_STATS_KEY, retrieve_admin_stats
+
+
+User = get_user_model()
+
+
+class AdminStatsCacheTest(TestCase):
+
+    def setUp(self):
+        cache.delete(ADMIN_STATS_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user('stats@test.com', 'password')
+
+    def test_full_save_drops_stats(self):
+        self.assertEqual(retrieve_admin_stats()['reserve'], 0)
+
+        self.user.balance = Decimal(100)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        self.assertEqual(retrieve_admin_stats()['reserve'], Decimal(100))
+
+    def test_save_of_other_fields_keeps_stats(self):
+        stats = retrieve_admin_stats()
+
+        self.user.can_invite = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['can_invite'])
+
+        self.assertEqual(cache.get(ADMIN_STATS_KEY), stats)
@@ -7,7 +7,8 @@ from .views import (LoginAdminUserView, GrantPermissionsView,
                     CreateCustomTokenWalletView, AdminStatsView,
                     AdminReportByDayView, AdminReportByRangeDaysView,
                     AdminStatsByClickUserView, RetrieveAllUsersPermissions,
-                    SetUserPermanentPlaceView, UsersPartnersStatsView,
+                    SetUserPermanentPlaceView, SetUsersPermanentPlacesView,
+                    UsersPartnersStatsView,
                     RetrieveAllVIPUsers, AdminStatsAKVIncomeView,
                     )
 
@@ -22,6 +23,7 @@ urlpatterns = [
     path('delete_vip_user/', DeleteVIPUserView.as_view(), name='delete_vip_user'),
 
     path('set_user_queue/', SetUserPermanentPlaceView.as_view(), name='set_user_queue'),
+    path('set_users_queue/', SetUsersPermanentPlacesView.as_view(), name='set_users_queue'),
     path('get_user_ido_allocation/', GetUserIDOView.as_view(), name='get_user_ido_allocation'),
     path('retrieve_users_info/', RetrieveUsersInformationView.as_view(), name='retrieve_users_info'),
 
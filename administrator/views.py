@@ -2,6 +2,8 @@ from datetime import datetime
 from logging import exception
 from re import X
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
 from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
@@ -11,19 +13,29 @@ from rest_framework.status import (HTTP_400_BAD_REQUEST,
 from knox.models import AuthToken
 
 from account.exceptions import (LoginUserError, EmailValidationError, RetrievePermissionsError,
-                                UserDoesNotExists)
+                                UserDoesNotExists, PaginationError)
 from account.models import GoogleAuth
-from account.serializers import EmailSerializer
-from account.services import paginate, retrieve_permissions, verify_google_code
+from account.partners import (annotate_ido_allocation,
+                              retrieve_users_partners_stats)
+from account.serializers import EmailSerializer, PartnersQuerySerializer
+from account.services import (PERMISSIONS_CODENAMES_REGEX,
+                              paginate_queryset, retrieve_page_params,
+                              retrieve_permissions, verify_google_code)
 from .exceptions import GrantPermissionsError, IncorrectDateError
 from .models import VIPUser
+from .reports import (day_start, retrieve_day_report, retrieve_months_report,
+                      retrieve_range_report)
 from .serializers import (PermissionsSerializer, LoginAdminSerializer,
                           AddVIPUserSerializer, ReportDaySerializer, ReportRangeDaysSerializer, UserPrioritySerializer,
-                          AdminCustomTokenWalletSerializer)
-from .services import (grant_permissions, refresh_queue_places,
+                          AdminCustomTokenWalletSerializer, UsersPrioritiesSerializer)
+from .services import (grant_permissions, retrieve_admin_stats,
                        retrieve_users_info)
+from ido.exceptions import QueueError
 from ido.models import IDOParticipant, QueueUser
+from ido.queue import set_permanent_places
 from core.models import Address, AdminWallet, Coin, MetamaskWallet, Transaction
+from core.portfolio import retrieve_portfolio
+from core.registry import get_coin
 
 
 User = get_user_model()
@@ -216,44 +228,39 @@ class SetUserPermanentPlaceView(GenericAPIView):
 
         user = User.objects.get(email=data['email'])
 
-        if not number:
-            if not user.permanent_place:
-                return Response(
-                    {"error": 'Пользователь не состоит в приоритетной очереди.'},
-                    status=HTTP_400_BAD_REQUEST
-                )
+        try:
+            set_permanent_places([(user, number)])
+        except Exception as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-            users = User.objects.filter(permanent_place__gt=user.permanent_place)
-            for u in users:
-                u.permanent_place -= 1
-                u.save()
+        return Response({'status': 'success'})
 
-            user.permanent_place = None
-            user.save()
 
-            refresh_queue_places(user)
+class SetUsersPermanentPlacesView(GenericAPIView):
+    """API endpoint to set priorities of many users at once.
+       Changes are applied in order of list."""
 
-            return Response({'status': 'success'})
+    serializer_class = UsersPrioritiesSerializer
+    permission_classes = (IsAdminUser,)
 
-        if number < 1:
-            return Response(
-                {"error": 'Номер в очереди не может быть меньше 1.'},
-                status=HTTP_400_BAD_REQUEST)
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
 
         try:
-            users = User.objects.filter(permanent_place__gte=number)
-            for u in users:
-                u.permanent_place += 1
-                u.save()
-
-            user.permanent_place = number
-            user.save()
-            refresh_queue_places(user)
-
-            return Response({'status': 'success'})
+            serializer.is_valid(raise_exception=True)
+        except (EmailValidationError, UserDoesNotExists, QueueError) as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        except Exception as e:
+        try:
+            ido_ids = set_permanent_places(serializer.validated_data)
+        except QueueError as e:
             return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            print(e)
+            return Response({"error": 'Ошибка изменения мест в очереди.'},
+                            status=HTTP_400_BAD_REQUEST)
+
+        return Response({'status': 'success', 'idos': ido_ids})
 
 
 class GetUserIDOView(GenericAPIView):
@@ -282,11 +289,18 @@ class RetrieveUsersInformationView(GenericAPIView):
     """API endpoint to get users info."""
 
     permission_classes = (IsAdminUser,)
+    serializer_class = PartnersQuerySerializer
 
     def get(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
         try:
             users = User.objects.all().order_by('email')
-            data = retrieve_users_info(users)
+            data = retrieve_users_info(users,
+                                       options.get('depth', 1),
+                                       options.get('fields'))
             return Response({'users': data}, status=HTTP_200_OK)
 
         except Exception as e:
@@ -306,16 +320,29 @@ class CreateCustomTokenWalletView(GenericAPIView):
         data = serializer.validated_data
 
         smrt = Address.objects.get(address=data['smartcontract'])
-        new_admin_address = Address.objects.create(
-            address=data['wallet_address'],
-            coin=smrt.coin,
-            owner_admin=True
-        )
+        decimals = data['decimal']
+
+        # Amounts of the coin are kept in base units of its admin wallet,
+        # registry is refreshed on creation of wallet
+        with transaction.atomic():
+            coin = Coin.objects.select_for_update().get(pk=smrt.coin_id)
+            if (coin.decimals != decimals
+                    and Transaction.objects.filter(coin=coin).exists()):
+                return Response({
+                    "error": 'Нельзя изменить множитель монеты, '
+                             'по которой уже есть транзакции.'},
+                    status=HTTP_400_BAD_REQUEST)
 
-        AdminWallet.objects.create(
-            wallet_address=new_admin_address,
-            decimal=data['decimal']
-        )
+            new_admin_address = Address.objects.create(
+                address=data['wallet_address'],
+                coin=coin,
+                owner_admin=True
+            )
+            Coin.objects.filter(pk=coin.pk).update(decimals=decimals)
+            AdminWallet.objects.create(
+                wallet_address=new_admin_address,
+                decimal=decimals
+            )
 
         try:
             return Response({'status': "success"})
@@ -336,35 +363,7 @@ class AdminStatsView(GenericAPIView):
         user = User.objects.get(email=request.user)
         if user.has_perm('statistics.add_statistics') or user.is_superuser:
             try:
-                participants = IDOParticipant.objects.all()
-                IDO_investment = sum(part.allocation for part in participants if part.allocation)
-                users = User.objects.all()
-                count_users = len(users)
-                count_users_pool = 0
-                for user_ in users:
-                    if user_.balance >= 651:
-                        count_users_pool += 1
-                pool = count_users_pool * 650
-
-                queue = set()
-                for q in QueueUser.objects.all():
-                    queue.add(q.user)
-
-                count_queues = len(queue)
-
-                busd_on_admin_wallet = sum(u.balance for u in users if u.balance)
-                referals_usd_on_admin_wallet = sum(u.referal_balance for u in users if u.referal_balance)
-
-                general_balance = busd_on_admin_wallet + referals_usd_on_admin_wallet
-
-                return Response({'investment': IDO_investment,
-                                 'count_users': count_users,
-                                 'pool': pool,
-                                 'users_in_queues': count_queues,
-                                 'balance': general_balance,
-                                 'reserve': busd_on_admin_wallet
-                                })
-
+                return Response(retrieve_admin_stats())
             except Exception as e:
                 print(e)
                 return Response({
@@ -386,23 +385,15 @@ class AdminStatsAKVIncomeView(GenericAPIView):
         user = User.objects.get(email=request.user)
         if user.has_perm('statistics.add_statistics') or user.is_superuser:
             current_year = datetime.now().year
-            months = range(1, 13)
             months_slug = ('Январь', 'Февраль', 'Март', 'Апрель',
                            'Май', 'Июнь', 'Июль', 'Август',
                            'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь')
 
-            coin = Coin.objects.get(name='BUSD')
+            coin = get_coin('BUSD')
 
-            result = {}
-
-            for index, month in enumerate(months):
-                transactions = Transaction.objects.filter(coin=coin,
-                                                          commission=True,
-                                                          date__month=month,
-                                                          date__year=current_year)
-                akv_income_by_day = sum(t.amount for t in transactions if t.amount)
-
-                result[months_slug[index]] = akv_income_by_day
+            by_months = retrieve_months_report(coin, current_year)
+            result = {months_slug[month - 1]: amounts['akv_income']
+                      for month, amounts in by_months.items()}
 
             return Response(result)
         else:
@@ -430,42 +421,14 @@ class AdminReportByDayView(GenericAPIView):
 
             day, month, year = serializer.validated_data
 
-            coin = Coin.objects.get(name='BUSD')
-            admin_address = Address.objects.get(coin=coin, owner_admin=True)
-            fill_busd_transactions = Transaction.objects.filter(address_to=admin_address,
-                                                                coin=coin,
-                                                                fill_up=True,
-                                                                date__day=day,
-                                                                date__month=month,
-                                                                date__year=year)
-            fill_reserve_by_day = sum(t.amount for t in fill_busd_transactions if t.amount)
-
-            takeoff_busd_transactions = Transaction.objects.filter(address_from=admin_address,
-                                                                   coin=coin,
-                                                                   received=True,
-                                                                   date__day=day,
-                                                                   date__month=month,
-                                                                   date__year=year)
-            takeoff_reserve_by_day = sum(t.amount for t in takeoff_busd_transactions if t.amount)
-
-            referals_transactions = Transaction.objects.filter(coin=coin,
-                                                         referal=True,
-                                                         date__day=day,
-                                                         date__month=month,
-                                                         date__year=year)
-            referals_by_day = sum(t.amount for t in referals_transactions if t.amount)
-            transactions_with_commission = Transaction.objects.filter(coin=coin,
-                                                                      commission=True,
-                                                                      date__day=day,
-                                                                      date__month=month,
-                                                                      date__year=year)
-            akv_income_by_day = sum(t.amount for t in transactions_with_commission if t.amount)
-
-            return Response({'fill_reserve': fill_reserve_by_day,
-                             'takeoff_reserve': takeoff_reserve_by_day,
-                             'referals': referals_by_day,
-                             'akv_income': akv_income_by_day,
-                            })
+            coin = get_coin('BUSD')
+            try:
+                report = retrieve_day_report(coin, day, month, year)
+            except IncorrectDateError as e:
+                return Response({"error": str(e)},
+                                status=HTTP_400_BAD_REQUEST)
+
+            return Response(report)
         else:
             return Response({
                 "error": 'У пользователя нет прав на получение статистики.'},
@@ -490,37 +453,18 @@ class AdminReportByRangeDaysView(GenericAPIView):
                                 status=HTTP_400_BAD_REQUEST)
 
             day_from, month_from, year_from, day_to, month_to, year_to  = serializer.validated_data
-            date_from = f'{year_from}-{month_from}-{day_from}'
-            date_to = f'{year_to}-{month_to}-{day_to}'
-
-            coin = Coin.objects.get(name='BUSD')
-            admin_address = Address.objects.get(coin=coin, owner_admin=True)
-            fill_busd_transactions = Transaction.objects.filter(address_to=admin_address,
-                                                                coin=coin,
-                                                                fill_up=True,
-                                                                date__range=[date_from, date_to])
-            fill_reserve_by_day = sum(t.amount for t in fill_busd_transactions if t.amount)
-
-            takeoff_busd_transactions = Transaction.objects.filter(address_from=admin_address,
-                                                                   coin=coin,
-                                                                   received=True,
-                                                                   date__range=[date_from, date_to])
-            takeoff_reserve_by_day = sum(t.amount for t in takeoff_busd_transactions if t.amount)
-
-            referals_transactions = Transaction.objects.filter(coin=coin,
-                                                         referal=True,
-                                                         date__range=[date_from, date_to])
-            referals_by_day = sum(t.amount for t in referals_transactions if t.amount)
-            transactions_with_commission = Transaction.objects.filter(coin=coin,
-                                                                      commission=True,
-                                                                      date__range=[date_from, date_to])
-            akv_income_by_day = sum(t.amount for t in transactions_with_commission if t.amount)
-
-            return Response({'fill_reserve': fill_reserve_by_day,
-                             'takeoff_reserve': takeoff_reserve_by_day,
-                             'referals': referals_by_day,
-                             'akv_income': akv_income_by_day,
-                            })
+
+            coin = get_coin('BUSD')
+            try:
+                report = retrieve_range_report(
+                            coin,
+                            day_start(day_from, month_from, year_from),
+                            day_start(day_to, month_to, year_to))
+            except IncorrectDateError as e:
+                return Response({"error": str(e)},
+                                status=HTTP_400_BAD_REQUEST)
+
+            return Response(report)
         else:
             return Response({
                 "error": 'У пользователя нет прав на получение статистики.'},
@@ -557,30 +501,22 @@ class AdminStatsByClickUserView(GenericAPIView):
         result = []
 
         try:
-            idos = IDOParticipant.objects.filter(user=user)
-            if idos:
-                for ido_part in idos:
-                    coin = ido_part.ido.coin
-                    allocation = ido_part.allocation
-                    refund_allocation = ido_part.refund_allocation
-                    ts = Transaction.objects.filter(address_to=metamask_user.wallet_address,
-                                                    coin=coin)
-                    amount_in_tokens = sum(t.amount for t in ts if t.amount)
-                    if coin.cost_in_busd:
-                        amount_in_busd = amount_in_tokens * coin.cost_in_busd
-                    else:
-                        amount_in_busd = 0
-
-                    income_from_income = ido_part.income_from_income
-
-
-                    result.append({
-                        'coin': coin.name,
-                        'allocation': allocation,
-                        'refund_allocation': refund_allocation,
-                        'amount_in_busd': amount_in_busd,
-                        'income_from_income': income_from_income
-                    })
+            idos = (IDOParticipant.objects
+                    .filter(user=user)
+                    .select_related('ido__coin'))
+            portfolio = retrieve_portfolio(metamask_user.wallet_address,
+                                           [ido_part.ido.coin for ido_part in idos])
+            for ido_part in idos:
+                position = portfolio[ido_part.ido.coin.pk]
+                result.append({
+                    'coin': position['coin'],
+                    'allocation': ido_part.allocation,
+                    'refund_allocation': ido_part.refund_allocation,
+                    'amount_in_busd': position['in_busd'],
+                    'income_from_income': ido_part.income_from_income,
+                    'price_updated_at': position['price_updated_at'],
+                    'price_stale': position['price_stale']
+                })
 
         except Exception as e:
             print(e)
@@ -604,25 +540,31 @@ class RetrieveAllUsersPermissions(GenericAPIView):
                     "error": 'У пользователя нет прав на получение информации о пользователях.'},
                     status=HTTP_403_FORBIDDEN)
 
-        result = []
+        users = (User.objects
+                 .filter(Q(is_staff=True) | Q(is_superuser=True) |
+                         Q(user_permissions__codename__regex=PERMISSIONS_CODENAMES_REGEX))
+                 .distinct()
+                 .prefetch_related('user_permissions'))
+        try:
+            cursor, page_number = retrieve_page_params(request)
+            page = paginate_queryset(users, ('email',), 6, cursor, page_number,
+                                     count_key='users_permissions')
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        users = User.objects.all().order_by('email')
-        for user in users:
+        result = []
+        for user in page['items']:
             try:
                 permissions = retrieve_permissions(user)
             except RetrievePermissionsError as e:
                 return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
             else:
-                if permissions:
-                    result.append({user.email: permissions})
-
-        result, count_pages, current_page = paginate(result,
-                                                     6,
-                                                     int(request.data.get('page', 1)))
+                result.append({user.email: permissions})
 
         return Response({'users': result,
-                         'count_pages': count_pages,
-                         'current_page': current_page})
+                         'count_pages': page['count_pages'],
+                         'current_page': page['current_page'],
+                         'next_cursor': page['next_cursor']})
 
 
 class RetrieveAllVIPUsers(GenericAPIView):
@@ -639,19 +581,21 @@ class RetrieveAllVIPUsers(GenericAPIView):
                     "error": 'У пользователя нет прав на получение информации о пользователях.'},
                     status=HTTP_403_FORBIDDEN)
 
-        result = []
-
-        vip_users = VIPUser.objects.all()
-        for vip_user in vip_users:
-            result.append({vip_user.user.email: vip_user.referal_profit})
+        try:
+            cursor, page_number = retrieve_page_params(request)
+            page = paginate_queryset(VIPUser.objects.select_related('user'),
+                                     ('id',), 6, cursor, page_number,
+                                     count_key='vip_users')
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        result, count_pages, current_page = paginate(result,
-                                                     6,
-                                                     int(request.data.get('page', 1)))
+        result = [{vip_user.user.email: vip_user.referal_profit}
+                  for vip_user in page['items']]
 
         return Response({'users': result,
-                         'count_pages': count_pages,
-                         'current_page': current_page})
+                         'count_pages': page['count_pages'],
+                         'current_page': page['current_page'],
+                         'next_cursor': page['next_cursor']})
 
 
 class RetrieveAllUsersPriorities(GenericAPIView):
@@ -668,20 +612,24 @@ class RetrieveAllUsersPriorities(GenericAPIView):
                     "error": 'У пользователя нет прав на получение информации о пользователях.'},
                     status=HTTP_403_FORBIDDEN)
 
-        result = []
-
-        users = User.objects.all()
-        for user in users:
-            if user.permanent_place:
-                result.append({user.email: user.permanent_place})
+        users = (User.objects
+                 .filter(permanent_place__isnull=False)
+                 .exclude(permanent_place=0)
+                 .values('id', 'email', 'permanent_place'))
+        try:
+            cursor, page_number = retrieve_page_params(request)
+            page = paginate_queryset(users, ('id',), 6, cursor, page_number,
+                                     count_key='users_priorities')
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        result, count_pages, current_page = paginate(result,
-                                                     6,
-                                                     int(request.data.get('page', 1)))
+        result = [{user['email']: user['permanent_place']}
+                  for user in page['items']]
 
         return Response({'users': result,
-                         'count_pages': count_pages,
-                         'current_page': current_page})
+                         'count_pages': page['count_pages'],
+                         'current_page': page['current_page'],
+                         'next_cursor': page['next_cursor']})
 
 
 class UsersPartnersStatsView(GenericAPIView):
@@ -697,21 +645,20 @@ class UsersPartnersStatsView(GenericAPIView):
                     "error": 'У пользователя нет прав на получение информации о пользователях.'},
                     status=HTTP_403_FORBIDDEN)
 
-        result = []
-
-        users = User.objects.all()
-        for user in users:
-            dict_user = {}
-            dict_user['info'] = user.as_json()
-            dict_user['stats'] = user.partners['stats']
-            result.append(dict_user)
+        try:
+            cursor, page_number = retrieve_page_params(request)
+            page = paginate_queryset(annotate_ido_allocation(
+                                        User.objects.select_related('telegram')),
+                                     ('id',), 10, cursor, page_number,
+                                     count_key='users')
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
-        result, count_pages, current_page = paginate(
-                                                result,
-                                                10,
-                                                int(request.data.get('page', 1))
-                                            )
+        users_stats = retrieve_users_partners_stats([user.pk for user in page['items']])
+        result = [{'info': user.as_json(), 'stats': users_stats[user.pk]}
+                  for user in page['items']]
 
         return Response({'users': result,
-                         'count_pages': count_pages,
-                         'current_page': current_page})
+                         'count_pages': page['count_pages'],
+                         'current_page': page['current_page'],
+                         'next_cursor': page['next_cursor']})
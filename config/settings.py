@@ -142,11 +142,37 @@ COINMARKETCAP_API_KEY = os.getenv('COINMARKETCAP_API_KEY',
                                   'cc32eb41-1867-478f-8610-75592817a613')
 ETHERSCAN_API = os.getenv('ETHERSCAN_API',
                           'M7YIPI177FP25ETG47N7G112DXXWNMATS6')
+ETHERSCAN_API_URL = os.getenv('ETHERSCAN_API_URL', 'https://api.etherscan.io/api')
+# Etherscan free plan allows 5 requests per second
+ETHERSCAN_RATE_LIMIT = float(os.getenv('ETHERSCAN_RATE_LIMIT', 5))
+COINGECKO_API_URL = os.getenv('COINGECKO_API_URL',
+                              'https://api.coingecko.com/api/v3')
+PANCAKESWAP_API_URL = os.getenv('PANCAKESWAP_API_URL',
+                                'https://api.pancakeswap.info/api/v2')
+
+# Outgoing HTTP requests to external APIs
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', 8))
+
+# Count of rows the balance of admin wallet is spread over
+ADMIN_WALLET_SHARDS = int(os.getenv('ADMIN_WALLET_SHARDS', 8))
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+
+# Shared between web and dramatiq workers processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', f'{REDIS_URL}/1'),
+    }
+}
 
 DRAMATIQ_BROKER = {
     "BROKER": "dramatiq.brokers.redis.RedisBroker",
     "OPTIONS": {
-        "url": "redis://localhost:6379",
+        "url": REDIS_URL,
     },
     "MIDDLEWARE": [
         "dramatiq.middleware.Prometheus",
@@ -162,7 +188,7 @@ DRAMATIQ_BROKER = {
 DRAMATIQ_RESULT_BACKEND = {
     "BACKEND": "dramatiq.results.backends.redis.RedisBackend",
     "BACKEND_OPTIONS": {
-        "url": "redis://localhost:6379",
+        "url": REDIS_URL,
     },
     "MIDDLEWARE_OPTIONS": {
         "result_ttl": 60000
@@ -11,7 +11,7 @@ class MetamaskWalletAdmin(admin.ModelAdmin):
 
 @admin.register(Coin)
 class CoinAdmin(admin.ModelAdmin):
-    list_display = ('name', 'network', 'cost_in_busd')
+    list_display = ('name', 'network', 'cost_in_busd', 'price_source', 'price_updated_at')
     ordering = ('name',)
 
 
@@ -0,0 +1,118 @@
+"""
+Changes of users and admin wallets balances. Every change is a single
+UPDATE with F() expression, taking off is guarded by condition on the
+balance in the same UPDATE, so parallel requests can't lose updates
+or take off more than there is. Balance of admin wallet is spread over
+shards rows (see core.shards). Transactions of operation are written
+in the same db transaction with balances, cached admin statistics are
+dropped after its commit.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+
+from administrator.services import invalidate_admin_stats
+
+from .exceptions import InsufficientFundsError
+from .models import Transaction
+from .shards import add_to_wallet, take_from_wallet
+
+
+User = get_user_model()
+
+TAKEOFF_COMMISSION = Decimal(1)
+
+
+def credit_user(user, amount: Decimal, field: str = 'balance'):
+    """Add amount to balance (or referal_balance, hold) of user."""
+    User.objects.filter(pk=user.pk).update(**{field: F(field) + amount})
+    invalidate_admin_stats()
+
+
+def debit_user(user, amount: Decimal, field: str = 'balance',
+               minimum=None) -> bool:
+    """Take off amount from balance (or referal_balance) of user if it is
+       not less than `minimum` (amount by default). Returns False if not."""
+    debited = bool(User.objects
+                   .filter(pk=user.pk,
+                           **{f'{field}__gte': amount if minimum is None else minimum})
+                   .update(**{field: F(field) - amount}))
+    if debited:
+        invalidate_admin_stats()
+    return debited
+
+
+def change_admin_wallet(admin_wallet, amount: Decimal):
+    """Add amount (may be negative) to balance of admin wallet."""
+    add_to_wallet(admin_wallet, amount)
+
+
+def debit_admin_wallet(admin_wallet, amount: Decimal,
+                       minimum: Decimal = None) -> bool:
+    """Take off amount from admin wallet if its balance is not less
+       than `minimum` (amount by default). Returns False if not."""
+    return take_from_wallet(admin_wallet, amount, minimum)
+
+
+def fill_user_reserve(user, address_from, admin_wallet, coin,
+                      amount: Decimal) -> Transaction:
+    """User sent amount to admin wallet: his reserve is filled."""
+    with transaction.atomic():
+        fill = Transaction.objects.create(address_from=address_from,
+                                          address_to=admin_wallet.wallet_address,
+                                          coin=coin,
+                                          amount=amount,
+                                          fill_up=True)
+        credit_user(user, amount)
+        change_admin_wallet(admin_wallet, amount)
+    return fill
+
+
+def takeoff_user_reserve(user, address_to, admin_wallet, coin, amount: Decimal,
+                         field: str = 'balance',
+                         commission: Decimal = TAKEOFF_COMMISSION) -> tuple:
+    """Send amount without commission from admin wallet to user, balance
+       of user (or referal balance) is decreased by amount.
+       Returns (takeoff, commission) transactions."""
+    if amount <= 0:
+        raise InsufficientFundsError('Сумма снятия должна быть больше нуля.')
+
+    minimum = amount + commission
+    if field == 'balance':
+        # Frozen by hold part of balance can't be taken off
+        minimum = F('hold') + minimum
+
+    with transaction.atomic():
+        if not debit_user(user, amount, field, minimum):
+            raise InsufficientFundsError(
+                'У пользователя не достаточно средств для снятия.')
+        # Admin wallet sends amount without commission and gets commission
+        if not debit_admin_wallet(admin_wallet, amount - 2 * commission,
+                                  minimum=amount + commission):
+            raise InsufficientFundsError(
+                'На кошельке главного аккаунта не достаточно средств.')
+
+        takeoff = Transaction.objects.create(address_from=admin_wallet.wallet_address,
+                                             address_to=address_to,
+                                             coin=coin,
+                                             amount=amount - commission,
+                                             received=True)
+        fee = Transaction.objects.create(address_from=address_to,
+                                         address_to=admin_wallet.wallet_address,
+                                         coin=coin,
+                                         amount=commission,
+                                         commission=True)
+    return takeoff, fee
+
+
+def move_referals_to_reserve(user, amount: Decimal):
+    """Move amount from referal balance of user to his reserve."""
+    moved = (User.objects
+             .filter(pk=user.pk, referal_balance__gte=amount)
+             .update(referal_balance=F('referal_balance') - amount,
+                     balance=F('balance') + amount))
+    if not moved:
+        raise InsufficientFundsError('Недостаточно реферальных средств.')
+    invalidate_admin_stats()
@@ -0,0 +1,156 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+
+from config.settings import (COINGECKO_API_URL, ETHERSCAN_API,
+                             ETHERSCAN_API_URL, ETHERSCAN_RATE_LIMIT,
+                             HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_TIMEOUT,
+                             PANCAKESWAP_API_URL)
+
+
+class RateLimiter:
+    """Thread-safe limiter of requests count per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class APIClient:
+    """HTTP client with one pooled session, timeouts, retries with backoff
+       and rate limiting per host. Safe to use from many threads."""
+
+    def __init__(self, rate_limit: float = None, timeout: float = HTTP_TIMEOUT,
+                 retries: int = HTTP_RETRIES, pool_size: int = HTTP_POOL_SIZE):
+        self.rate_limit = rate_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.limiters = {}
+        self.limiters_lock = threading.Lock()
+
+        self.session = Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries,
+                              backoff_factor=0.5,
+                              status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=('GET',)))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def limiter(self, url: str) -> RateLimiter:
+        host = urlparse(url).netloc
+        with self.limiters_lock:
+            if host not in self.limiters:
+                self.limiters[host] = RateLimiter(self.rate_limit)
+            return self.limiters[host]
+
+    def get_json(self, url: str, params: dict = None):
+        self.limiter(url).wait()
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class EtherscanClient(APIClient):
+    """Client of Etherscan API."""
+
+    def __init__(self, base_url: str = ETHERSCAN_API_URL,
+                 api_key: str = ETHERSCAN_API,
+                 rate_limit: float = ETHERSCAN_RATE_LIMIT, **kwargs):
+        super().__init__(rate_limit=rate_limit, **kwargs)
+        self.base_url = base_url
+        self.api_key = api_key
+
+    def token_balance(self, contract: str, address: str):
+        """Balance of address in tokens of contract (in minimal units).
+           Returns None if balance wasn't retrieved."""
+        params = {'module': 'account',
+                  'action': 'tokenbalance',
+                  'contractaddress': contract,
+                  'address': address,
+                  'tag': 'latest',
+                  'apikey': self.api_key}
+
+        for attempt in range(self.retries + 1):
+            try:
+                # {'status': '1', 'message': 'OK', 'result': '135499'}
+                data = self.get_json(self.base_url, params)
+            except (RequestException, ValueError) as e:
+                print(f'Etherscan error for {address}: {e}')
+                return None
+
+            if data.get('message') == 'OK':
+                return data.get('result')
+
+            # Etherscan answers "NOTOK" with status 200 if rate limit is reached
+            if 'rate limit' not in str(data.get('result', '')).lower():
+                print(f'Etherscan error for {address}: {data}')
+                return None
+            time.sleep(0.5 * 2 ** attempt)
+
+        return None
+
+    def token_balances(self, pairs: list, workers: int) -> list:
+        """Balances of many (contract, address) pairs concurrently,
+           in order of pairs."""
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda pair: self.token_balance(*pair),
+                                     pairs))
+
+
+class CoinGeckoClient(APIClient):
+    """Client of CoinGecko API (same methods as pycoingecko.CoinGeckoAPI)."""
+
+    def __init__(self, base_url: str = COINGECKO_API_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+
+    def get_coins_list(self) -> list:
+        # [{'id': 'zyx', 'symbol': 'zyx', 'name': 'ZYX'}, ...]
+        return self.get_json(f'{self.base_url}/coins/list')
+
+    def get_price(self, ids, vs_currencies: str = 'usd') -> dict:
+        # {'binance-usd': {'usd': 1.001}, ...}
+        if not isinstance(ids, str):
+            ids = ','.join(ids)
+        return self.get_json(f'{self.base_url}/simple/price',
+                             {'ids': ids, 'vs_currencies': vs_currencies})
+
+
+class PancakeSwapClient(APIClient):
+    """Client of PancakeSwap info API."""
+
+    def __init__(self, base_url: str = PANCAKESWAP_API_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+
+    def get_tokens(self) -> dict:
+        # {contract: {'name': 'PancakeSwap Token', 'symbol': 'Cake',
+        #             'price': '4.24', 'price_BNB': '0.0145'}, ...}
+        return self.get_json(f'{self.base_url}/tokens').get('data') or {}
+
+    def token_info(self, search: str):
+        """Info of token by symbol or contract address (as defi_tools.pcsTokenInfo).
+           Returns None if token is not found."""
+        search = 'WBNB' if search.upper() == 'BNB' else search.upper()
+        for contract, values in self.get_tokens().items():
+            if search in (values['symbol'].upper(), contract.upper()):
+                return values
+        return None
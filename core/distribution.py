@@ -0,0 +1,249 @@
+"""
+Batched distribution of IDO tokens between participants:
+all data is preloaded by few queries, payouts are computed in memory
+and written by bulk_create in one db transaction.
+"""
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+
+from account.models import ReferalTree
+from administrator.models import VIPUser
+from ido.models import IDOParticipant
+
+from .exceptions import CommissionError, MetamaskWalletExistsError
+from .models import AdminWallet, Address, MetamaskWallet, Transaction
+from .money import money_context, parts, round_amounts, split
+from .prices import get_fresh_price
+from .rollup import add_to_rollup
+from .units import coin_decimals, fill_units
+
+
+# Platform commission from participant income
+COMMISSION = Decimal('0.35')
+
+# Referal percents of inviters of 1, 2 and 3 lines
+LINES_PERCENTS = (Decimal('0.06'), Decimal('0.04'), Decimal('0.02'))
+
+# Referal commission is charged only after refund of this allocation
+REFUND_ALLOCATION = 650
+
+PLAN_VERSION_KEY = 'payout_plan:version'
+PLAN_TIMEOUT = 60 * 60
+
+
+def referal_percents(inviters_ids: list, vip_profits: dict) -> list:
+    """Help function to count referal percents of user inviters.
+       Inviters of first 3 lines get LINES_PERCENTS, VIP inviters of any line
+       get their own profit. Returns [(inviter_id, percent), ...]."""
+    percents = []
+    for index, inviter_id in enumerate(inviters_ids):
+        if inviter_id in vip_profits:
+            # Profit is kept as float percent, it is taken as it was typed
+            profit = vip_profits[inviter_id] or 0
+            percents.append((inviter_id, Decimal(str(profit)) / 100))
+        elif index < len(LINES_PERCENTS):
+            percents.append((inviter_id, LINES_PERCENTS[index]))
+    return percents
+
+
+def load_inviters(users_ids) -> dict:
+    """Inviters ids (from the first line) of many users in one query."""
+    inviters = defaultdict(list)
+    links = (ReferalTree.objects
+             .filter(descendant_id__in=users_ids, depth__gte=1)
+             .order_by('descendant_id', 'depth')
+             .values_list('descendant_id', 'ancestor_id'))
+    for user_id, inviter_id in links:
+        inviters[user_id].append(inviter_id)
+    return inviters
+
+
+def load_vip_profits(users_ids) -> dict:
+    return dict(VIPUser.objects
+                .filter(user_id__in=users_ids)
+                .values_list('user_id', 'referal_profit'))
+
+
+def load_wallets(users_ids) -> dict:
+    """Metamask addresses ids of users: {user_id: address_id}."""
+    return dict(MetamaskWallet.objects
+                .filter(user_id__in=users_ids)
+                .values_list('user_id', 'wallet_address_id'))
+
+
+def build_payout_plan(users_ids) -> dict:
+    """Payout plan of users: metamask address of user and list of
+       (inviter metamask address, referal percent) for every user.
+       Returns {user_id: (address_id, [(address_id, percent), ...])},
+       address_id is None if metamask is not binded."""
+    inviters = load_inviters(users_ids)
+    all_inviters = {i for user_inviters in inviters.values() for i in user_inviters}
+    vip_profits = load_vip_profits(all_inviters) if all_inviters else {}
+    wallets = load_wallets(set(users_ids) | all_inviters)
+
+    plan = {}
+    for user_id in users_ids:
+        percents = referal_percents(inviters.get(user_id, []), vip_profits)
+        plan[user_id] = (wallets.get(user_id),
+                         [(wallets.get(inviter_id), percent)
+                          for inviter_id, percent in percents])
+    return plan
+
+
+def _plan_version() -> int:
+    cache.add(PLAN_VERSION_KEY, 1, timeout=None)
+    return cache.get(PLAN_VERSION_KEY, 1)
+
+
+def _drop_payout_plans():
+    try:
+        cache.incr(PLAN_VERSION_KEY)
+    except ValueError:
+        cache.add(PLAN_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_payout_plans():
+    """Drop all cached payout plans after commit of current changes
+       (on change of VIP users, inviters or metamask wallets), so plans
+       built from old data are not cached under the new version."""
+    transaction.on_commit(_drop_payout_plans)
+
+
+def get_payout_plan(users_ids) -> dict:
+    """Cached payout plan of users (see build_payout_plan)."""
+    users_ids = list(users_ids)
+    version = _plan_version()
+    keys = {f'payout_plan:{version}:{user_id}': user_id for user_id in users_ids}
+
+    cached = cache.get_many(keys)
+    plan = {keys[key]: value for key, value in cached.items()}
+
+    missing = [user_id for user_id in users_ids if user_id not in plan]
+    if missing:
+        built = build_payout_plan(missing)
+        cache.set_many({f'payout_plan:{version}:{user_id}': value
+                        for user_id, value in built.items()},
+                       timeout=PLAN_TIMEOUT)
+        plan.update(built)
+    return plan
+
+
+def _address(address_id):
+    if address_id is None:
+        raise MetamaskWalletExistsError('Такой кошелек не привязан ни к какому аккаунту.')
+    return address_id
+
+
+def take_commission(participant, tokens: Decimal, user_plan: tuple,
+                    wallet: AdminWallet) -> tuple:
+    """Platform commission and referal bonuses from participant income.
+       Bonuses and commission are rounded down to decimals of coin,
+       participant gets the rest. StalePriceError is raised if price
+       of coin is stale, before anything is written.
+       Returns (transactions, tokens left to participant)."""
+    if participant.refund_allocation < REFUND_ALLOCATION:
+        return [], tokens
+
+    coin = wallet.wallet_address.coin
+    address_id, percents = user_plan
+
+    with money_context():
+        summ_commission = sum(percent for _, percent in percents)
+        if summ_commission > COMMISSION:
+            raise CommissionError('Бонусы инвайтерам с дохода пользователя больше 35%.')
+        rates = [percent for _, percent in percents] + [COMMISSION - summ_commission]
+
+    *referals, commission = parts(tokens, rates, coin_decimals(coin.pk))
+    transactions = [Transaction(address_from_id=_address(address_id),
+                                address_to_id=_address(inviter_address_id),
+                                coin=coin,
+                                amount=referal,
+                                referal=True)
+                    for (inviter_address_id, _), referal in zip(percents, referals)]
+    transactions.append(Transaction(address_from_id=_address(address_id),
+                                    address_to=wallet.wallet_address,
+                                    coin=coin,
+                                    amount=commission,
+                                    commission=True))
+
+    # Income is counted in BUSD, distribution is refused on stale price
+    cost = get_fresh_price(coin)
+    with money_context():
+        participant.income_from_income += float(COMMISSION * tokens * cost)
+        return transactions, tokens - sum(referals) - commission
+
+
+def pay_participants(wallet: AdminWallet, smartcontract: Address,
+                     payments: list, with_referals: bool = True) -> dict:
+    """Charge tokens to IDO participants.
+       `payments` - list of (IDOParticipant, tokens).
+       If `with_referals`, platform commission and referal bonuses
+       are taken from tokens of participants who refunded allocation.
+       Returns counts of written rows and timings of stages (seconds)."""
+    stats = {}
+    started = time.perf_counter()
+    plan = get_payout_plan({part.user_id for part, _ in payments})
+    stats['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    transactions = []
+    changed_participants = []
+    amounts = round_amounts([tokens for _, tokens in payments],
+                            coin_decimals(smartcontract.coin_id))
+    for (participant, _), tokens in zip(payments, amounts):
+        user_plan = plan[participant.user_id]
+
+        if with_referals:
+            income = participant.income_from_income
+            commissions, tokens = take_commission(participant, tokens,
+                                                  user_plan, wallet)
+            transactions.extend(commissions)
+            if participant.income_from_income != income:
+                changed_participants.append(participant)
+
+        transactions.append(Transaction(
+            address_from=smartcontract,
+            address_to_id=_address(user_plan[0]),
+            coin=smartcontract.coin,
+            amount=tokens))
+    stats['compute'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        Transaction.objects.bulk_create(fill_units(transactions), batch_size=1000)
+        add_to_rollup(transactions)
+        IDOParticipant.objects.bulk_update(changed_participants,
+                                           ['income_from_income'],
+                                           batch_size=1000)
+    stats['write'] = time.perf_counter() - started
+
+    stats['participants'] = len(payments)
+    stats['transactions'] = len(transactions)
+    return stats
+
+
+def split_by_allocation(ido, wallet: AdminWallet, amount: Decimal) -> list:
+    """Split amount of tokens between IDO participants by their allocation
+       (see core.money.split). Returns [(IDOParticipant, tokens), ...]."""
+    participants = [part for part in IDOParticipant.objects.filter(ido=ido)
+                    if part.allocation]
+    shares = split(amount, [part.allocation for part in participants],
+                   coin_decimals(wallet.wallet_address.coin_id))
+    return list(zip(participants, shares))
+
+
+def distribute(ido, wallet: AdminWallet, smartcontract: Address,
+               amount: Decimal, with_referals: bool = True) -> dict:
+    """Distribute amount of tokens between all IDO participants."""
+    started = time.perf_counter()
+    payments = split_by_allocation(ido, wallet, amount)
+    split_time = time.perf_counter() - started
+
+    stats = pay_participants(wallet, smartcontract, payments, with_referals)
+    stats['load'] += split_time
+    print(f'Distribution IDO {ido.pk}: {stats}')
+    return stats
@@ -19,3 +19,15 @@ class CommissionError(CoreError):
     def __init__(self, error) -> None:
         self.error = error
         super().__init__(error)
+
+
+class InsufficientFundsError(CoreError):
+    def __init__(self, error) -> None:
+        self.error = error
+        super().__init__(error)
+
+
+class StalePriceError(CoreError):
+    def __init__(self, error) -> None:
+        self.error = error
+        super().__init__(error)
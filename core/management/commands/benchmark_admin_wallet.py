@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.db.models import F
+
+from core.management.databases import add_live_db_argument, benchmark_database
+from core.models import Address, AdminWallet, Coin
+from core.shards import add_to_wallet, count_wallet_balance, take_from_wallet
+
+
+def single_row_add(wallet, amount):
+    AdminWallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + amount)
+
+
+def single_row_take(wallet, amount) -> bool:
+    return bool(AdminWallet.objects
+                .filter(pk=wallet.pk, balance__gte=amount)
+                .update(balance=F('balance') - amount))
+
+
+MODES = {
+    'single': (single_row_add, single_row_take),
+    'sharded': (add_to_wallet, take_from_wallet),
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure writes per second of parallel changes of admin wallet '
+            'balance: one row against sharded balance. Runs on a temporary '
+            'database unless --live-db is given')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--takeoff-ratio', type=float, default=0.2,
+                            help='Part of writes which are guarded takeoffs')
+        parser.add_argument('--retries', type=int, default=50,
+                            help='Retries of write on database lock errors')
+        add_live_db_argument(parser)
+
+    def run(self, mode: str, wallet, options) -> dict:
+        add, take = MODES[mode]
+        stats = {'adds': 0, 'takes': 0, 'rejected': 0, 'failed': 0,
+                 'added': Decimal(0), 'taken': Decimal(0)}
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker():
+            close_old_connections()
+            local = dict.fromkeys(stats, 0)
+            try:
+                barrier.wait()
+                finish = time.perf_counter() + options['seconds']
+                while time.perf_counter() < finish:
+                    amount = Decimal(random.randint(1, 100))
+                    is_take = random.random() < options['takeoff_ratio']
+                    for attempt in range(options['retries'] + 1):
+                        try:
+                            if is_take:
+                                if take(wallet, amount):
+                                    local['takes'] += 1
+                                    local['taken'] += amount
+                                else:
+                                    local['rejected'] += 1
+                            else:
+                                add(wallet, amount)
+                                local['adds'] += 1
+                                local['added'] += amount
+                            break
+                        except OperationalError:
+                            if attempt == options['retries']:
+                                local['failed'] += 1
+                            time.sleep(0.001 * (attempt + 1))
+            finally:
+                connection.close()
+            with lock:
+                for key, value in local.items():
+                    stats[key] += value
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def handle(self, *args, **options):
+        with benchmark_database(options['live_db']):
+            self.compare(options)
+
+    def compare(self, options):
+        coin = Coin.objects.create(name='BMWL', network='benchmark-wallet')
+        address = Address.objects.create(address='benchmark-admin-wallet',
+                                         coin=coin, owner_admin=True)
+        try:
+            print(f'{"mode":8} {"writes/s":>10} {"adds":>8} {"takeoffs":>9} '
+                  f'{"rejected":>9} {"failed":>7} {"lost":>6}')
+            for mode in MODES:
+                wallet = AdminWallet.objects.create(wallet_address=address,
+                                                    balance=1000)
+                stats = self.run(mode, wallet, options)
+                writes = stats['adds'] + stats['takes'] + stats['rejected']
+                expected = 1000 + stats['added'] - stats['taken']
+                lost = expected - count_wallet_balance(wallet)
+                print(f'{mode:8} {writes / options["seconds"]:10.0f} '
+                      f'{stats["adds"]:8} {stats["takes"]:9} '
+                      f'{stats["rejected"]:9} {stats["failed"]:7} {lost:6.0f}')
+                wallet.delete()
+        finally:
+            address.delete()
+            coin.delete()
+
+        if connection.vendor == 'sqlite':
+            print('SQLite locks whole database on write, '
+                  'run on PostgreSQL to compare row locks')
@@ -0,0 +1,165 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.management.databases import add_live_db_argument, benchmark_database
+from core.models import Address, Coin, Transaction
+from core.units import fill_units
+
+
+def _sum(transactions):
+    return sum(t.amount for t in transactions if t.amount)
+
+
+def query_shapes(ctx: dict) -> dict:
+    """Transaction filters of views (as they are evaluated by views)."""
+    user, admin, coin, busd = ctx['user'], ctx['admin'], ctx['coin'], ctx['busd']
+    day, date_from, date_to = ctx['day'], ctx['date_from'], ctx['date_to']
+    return {
+        'DashboardView referal income': lambda: _sum(Transaction.objects.filter(
+            address_to=user, coin=busd, referal=True,
+            date__month=day.month, date__year=day.year)),
+        'ReferalChargesView': lambda: list(Transaction.objects.filter(
+            address_to=user, referal=True).order_by('date')),
+        'UserIDOsStatsView received': lambda: _sum(Transaction.objects.filter(
+            address_to=user, coin=coin, received=True)),
+        'TryTakeOffIDOTokensView': lambda: _sum(Transaction.objects.filter(
+            address_to=user, coin=coin, received=False)),
+        'AdminReportByDayView fill': lambda: _sum(Transaction.objects.filter(
+            address_to=admin, coin=busd, fill_up=True,
+            date__day=day.day, date__month=day.month, date__year=day.year)),
+        'AdminReportByDayView commission': lambda: _sum(Transaction.objects.filter(
+            coin=busd, commission=True,
+            date__day=day.day, date__month=day.month, date__year=day.year)),
+        'AdminReportByRangeDaysView fill': lambda: _sum(Transaction.objects.filter(
+            address_to=admin, coin=busd, fill_up=True,
+            date__range=[date_from, date_to])),
+        'AdminReportByRangeDaysView takeoff': lambda: _sum(Transaction.objects.filter(
+            address_from=admin, coin=busd, received=True,
+            date__range=[date_from, date_to])),
+        'AdminReportByRangeDaysView referal': lambda: _sum(Transaction.objects.filter(
+            coin=busd, referal=True, date__range=[date_from, date_to])),
+        'AdminStatsAKVIncomeView month': lambda: _sum(Transaction.objects.filter(
+            coin=busd, commission=True,
+            date__month=day.month, date__year=day.year)),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Seed benchmark transactions and measure latency of views '
+            'filters without and with composite Transaction indexes '
+            '(on a temporary database unless --live-db is given)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep', action='store_true',
+                            help="Don't delete seeded data")
+        add_live_db_argument(parser)
+
+    def seed(self, options) -> dict:
+        coins = [Coin.objects.create(name=f'BM{i}', network=f'benchmark-{i}')
+                 for i in range(3)]
+        busd = coins[0]
+        admin = Address.objects.create(address='benchmark-admin', coin=busd,
+                                       owner_admin=True)
+        Address.objects.bulk_create(
+            [Address(address=f'benchmark-{i}', coin=busd)
+             for i in range(options['users'])],
+            batch_size=options['batch_size'])
+        users = list(Address.objects.filter(address__startswith='benchmark-',
+                                            owner_admin=False))
+
+        now = timezone.now()
+        per_day = max(1, options['count'] // options['days'])
+        started = time.perf_counter()
+        for day in range(options['days']):
+            seeded_at = timezone.now()
+            rows = []
+            for _ in range(per_day):
+                kind = random.random()
+                user = random.choice(users)
+                rows.append(Transaction(
+                    address_from=admin if kind < 0.3 else random.choice(users),
+                    address_to=admin if 0.3 <= kind < 0.4 else user,
+                    coin=random.choice(coins),
+                    amount=Decimal(random.randint(1, 10 ** 6)) / 100,
+                    referal=0.4 <= kind < 0.6,
+                    commission=0.6 <= kind < 0.7,
+                    fill_up=0.3 <= kind < 0.4,
+                    received=random.random() < 0.5,
+                    visible=random.random() < 0.8))
+            Transaction.objects.bulk_create(fill_units(rows),
+                                            batch_size=options['batch_size'])
+            # date is auto_now_add, move just created rows to their day
+            (Transaction.objects
+             .filter(coin__in=coins, date__gte=seeded_at)
+             .update(date=now - timedelta(days=day, minutes=random.randint(0, 1439))))
+        print(f'Seeded {per_day * options["days"]} transactions '
+              f'in {time.perf_counter() - started:.1f}s')
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        day = now - timedelta(days=options['days'] // 2)
+        return {'coins': coins, 'busd': busd, 'coin': coins[1], 'admin': admin,
+                'user': random.choice(users), 'day': day,
+                'date_from': day - timedelta(days=30), 'date_to': day}
+
+    def measure(self, ctx: dict, repeat: int) -> dict:
+        result = {}
+        for name, query in query_shapes(ctx).items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - started)
+            result[name] = statistics.median(timings) * 1000
+        return result
+
+    def handle(self, *args, **options):
+        # Indexes of Transaction are dropped while measuring, so by default
+        # it is done on a temporary database
+        with benchmark_database(options['live_db']):
+            self.run(options)
+
+    def run(self, options):
+        ctx = self.seed(options)
+        indexes = Transaction._meta.indexes
+        removed = False
+        try:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(Transaction, index)
+            removed = True
+            before = self.measure(ctx, options['repeat'])
+
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Transaction, index)
+            removed = False
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            after = self.measure(ctx, options['repeat'])
+        finally:
+            if removed:
+                with connection.schema_editor() as editor:
+                    for index in indexes:
+                        editor.add_index(Transaction, index)
+            if not options['keep']:
+                Transaction.objects.filter(coin__in=ctx['coins']).delete()
+                Address.objects.filter(address__startswith='benchmark-').delete()
+                Coin.objects.filter(pk__in=[coin.pk for coin in ctx['coins']]).delete()
+
+        print(f'{"query":40} {"FK indexes, ms":>15} {"all indexes, ms":>16}')
+        for name in before:
+            print(f'{name:40} {before[name]:15.2f} {after[name]:16.2f}')
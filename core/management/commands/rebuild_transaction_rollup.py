@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.rollup import BATCH_SIZE, rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily rollup of transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Rebuild only last days (all by default)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        date_from = None
+        if options['days']:
+            today = timezone.localtime().replace(hour=0, minute=0, second=0,
+                                                 microsecond=0)
+            date_from = today - timedelta(days=options['days'] - 1)
+
+        count = rebuild_rollup(date_from, options['batch_size'])
+        print(f'Transactions rollup rebuilt: {count} rows')
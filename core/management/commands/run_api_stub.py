@@ -0,0 +1,151 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+
+from core.models import Coin
+
+
+class StubState:
+    """Scripted answers of stand-in APIs.
+
+       Script (JSON file) may contain:
+        - balances: {address: raw balance or list of raw balances,
+                     next one is returned on every request, last one repeats}
+        - coins: [{'id': ..., 'symbol': ..., 'name': ...}] - CoinGecko coins list
+        - prices: {coingecko id: price in usd}
+        - tokens: {contract: {'name', 'symbol', 'price', 'price_BNB'}} - PancakeSwap
+       Missing parts are generated from coins in db."""
+
+    def __init__(self, script: dict, default_balance: str, list_size: int):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.default_balance = default_balance
+        self.balances = {address.lower(): value if isinstance(value, list) else [value]
+                         for address, value in script.get('balances', {}).items()}
+        self.balances_calls = {}
+
+        names = list(Coin.objects.values_list('name', flat=True))
+        self.coins = script.get('coins') or (
+            [{'id': f'{name.lower()}-token', 'symbol': name.lower(), 'name': name}
+             for name in names] +
+            [{'id': f'filler-{i}', 'symbol': f'fil{i}', 'name': f'Filler {i}'}
+             for i in range(list_size)])
+        self.prices = script.get('prices') or {coin['id']: 1.0 for coin in self.coins}
+        self.tokens = script.get('tokens') or {
+            f'0x{i:040x}': {'name': name, 'symbol': name, 'price': '1', 'price_BNB': '0.003'}
+            for i, name in enumerate(names, start=1)}
+
+    def balance(self, address: str) -> str:
+        address = address.lower()
+        with self.lock:
+            values = self.balances.get(address)
+            if not values:
+                return self.default_balance
+            call = self.balances_calls.get(address, 0)
+            self.balances_calls[address] = call + 1
+            return values[min(call, len(values) - 1)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers like Etherscan (/api), CoinGecko (/coins/list, /simple/price)
+       and PancakeSwap (/tokens) depending on path suffix."""
+
+    def do_GET(self):
+        server = self.server
+        with server.state.lock:
+            server.state.requests += 1
+
+        if server.latency or server.jitter:
+            time.sleep(max(0, random.gauss(server.latency, server.jitter)))
+
+        if random.random() < server.error_rate:
+            return self.answer({'error': 'stub error'}, status=503)
+
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+
+        if path.endswith('/api'):
+            if params.get('action') != 'tokenbalance':
+                return self.answer({'status': '0', 'message': 'NOTOK',
+                                    'result': 'Error! Unknown action'})
+            return self.answer({'status': '1', 'message': 'OK',
+                                'result': server.state.balance(params.get('address', ''))})
+
+        if path.endswith('/coins/list'):
+            return self.answer(server.state.coins)
+
+        if path.endswith('/simple/price'):
+            currency = params.get('vs_currencies', 'usd')
+            return self.answer({coin_id: {currency: server.state.prices[coin_id]}
+                                for coin_id in params.get('ids', '').split(',')
+                                if coin_id in server.state.prices})
+
+        if path.endswith('/tokens'):
+            return self.answer({'updated_at': int(time.time() * 1000),
+                                'data': server.state.tokens})
+
+        return self.answer({'error': 'not found'}, status=404)
+
+    def answer(self, data, status: int = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = 'Run local stand-in of Etherscan, CoinGecko and PancakeSwap APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8800)
+        parser.add_argument('--latency', type=float, default=0.1,
+                            help='Mean latency of answer, seconds')
+        parser.add_argument('--jitter', type=float, default=0.0,
+                            help='Standard deviation of latency, seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Share of requests answered with 503')
+        parser.add_argument('--script', help='JSON file with balances and prices')
+        parser.add_argument('--default-balance', default='0')
+        parser.add_argument('--list-size', type=int, default=13000,
+                            help='Count of filler coins in CoinGecko list')
+        parser.add_argument('--verbose', action='store_true')
+
+    def handle(self, *args, **options):
+        script = {}
+        if options['script']:
+            with open(options['script']) as file:
+                script = json.load(file)
+
+        server = ThreadingHTTPServer((options['host'], options['port']), StubHandler)
+        server.daemon_threads = True
+        server.state = StubState(script, options['default_balance'], options['list_size'])
+        server.latency = options['latency']
+        server.jitter = options['jitter']
+        server.error_rate = options['error_rate']
+        server.verbose = options['verbose']
+
+        base = f'http://{options["host"]}:{server.server_port}'
+        print('Stub API is running, use:')
+        print(f'  ETHERSCAN_API_URL={base}/etherscan/api')
+        print(f'  COINGECKO_API_URL={base}/coingecko/api/v3')
+        print(f'  PANCAKESWAP_API_URL={base}/pancakeswap/api/v2')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            print(f'Stub API stopped, {server.state.requests} requests served')
@@ -5,7 +5,8 @@ import pytz
 from apscheduler.triggers.cron import CronTrigger
 
 from core.periodic_tasks import (periodically_run_job,
-                                 periodically_run_job_2)
+                                 periodically_run_job_2,
+                                 periodically_run_job_3)
 
 
 scheduler = BlockingScheduler(timezone=pytz.UTC)
@@ -20,5 +21,6 @@ class Command(BaseCommand):
         cron = CronTrigger(hour='*', minute='*', second='*/30', timezone=pytz.UTC)
         scheduler.add_job(periodically_run_job, cron)
         scheduler.add_job(periodically_run_job_2, cron)
+        scheduler.add_job(periodically_run_job_3, cron)
         print('Start scheduler')
         scheduler.start()
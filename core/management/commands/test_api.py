@@ -14,9 +14,7 @@ from ido.models import IDO, IDOParticipant
 
 from config.settings import COINMARKETCAP_API_KEY
 
-from pycoingecko import CoinGeckoAPI
-# from pythonpancakes import PancakeSwapAPI
-import defi.defi_tools as dft
+from core.clients import CoinGeckoClient, PancakeSwapClient
 from decimal import getcontext, Decimal
 
 class Command(BaseCommand):
@@ -28,7 +26,7 @@ class Command(BaseCommand):
         getcontext().prec = 50
         try:
             if busd:
-                cg = CoinGeckoAPI()
+                cg = CoinGeckoClient()
                 coins_list = cg.get_coins_list()
                 print('BUSD')
 
@@ -70,7 +68,7 @@ class Command(BaseCommand):
 
         if coins:
             if not busd.cost_in_busd:
-                result_dict = dft.pcsTokenInfo(busd.name.lower())
+                result_dict = PancakeSwapClient().token_info(busd.name.lower())
                 print(result_dict)
                 busd.cost_in_busd = Decimal(result_dict['price'])
                 busd.save()
@@ -79,7 +77,7 @@ class Command(BaseCommand):
                 # {'name': 'PancakeSwap Token', 'symbol': 'Cake', 'price': '4.24055384017923644065998435584', 'price_BNB': '0.01455523752570393902803485311494'}
                 try:
                     print(coin.name)
-                    result_dict = dft.pcsTokenInfo(coin.name.lower())
+                    result_dict = PancakeSwapClient().token_info(coin.name.lower())
                     print(result_dict)
                     if result_dict:
                         coin.cost_in_busd = Decimal(result_dict['price']) * busd.cost_in_busd
@@ -0,0 +1,37 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import setup_databases, teardown_databases
+
+
+def add_live_db_argument(parser):
+    parser.add_argument('--live-db', action='store_true',
+                        help='Seed and measure on the configured database '
+                             'instead of a temporary one')
+
+
+@contextmanager
+def benchmark_database(live: bool = False):
+    """Temporary migrated database for commands seeding benchmark data,
+       the configured database is used only if `live`."""
+    if live:
+        yield
+        return
+
+    connection = connections[DEFAULT_DB_ALIAS]
+    path = None
+    if connection.vendor == 'sqlite':
+        # Threads of benchmarks need a file, not a shared in-memory database
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connection.settings_dict['TEST']['NAME'] = path
+    config = setup_databases(verbosity=1, interactive=False,
+                             aliases={DEFAULT_DB_ALIAS})
+    try:
+        yield
+    finally:
+        teardown_databases(config, verbosity=1)
+        if path and os.path.exists(path):
+            os.remove(path)
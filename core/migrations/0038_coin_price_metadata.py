@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_alter_transaction_fill_up'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coin',
+            name='price_source',
+            field=models.CharField(blank=True, max_length=16, null=True, verbose_name='Source of BUSD cost'),
+        ),
+        migrations.AddField(
+            model_name='coin',
+            name='price_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='BUSD cost update time'),
+        ),
+    ]
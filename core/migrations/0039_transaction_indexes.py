@@ -0,0 +1,37 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_coin_price_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['address_to', 'coin'], name='core_transa_address_1c96b5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['address_from', 'coin', 'date'], name='core_transa_address_c31aa9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('referal', True)), fields=['address_to', 'date'], name='transaction_referal_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('referal', True)), fields=['coin', 'date'], name='transaction_referal_coin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('commission', True)), fields=['coin', 'date'], name='transaction_commission_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('fill_up', True)), fields=['address_to', 'coin', 'date'], name='transaction_fill_up_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_transactionrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminWalletShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Shard number')),
+                ('balance', models.DecimalField(decimal_places=50, default=0, max_digits=100, verbose_name='Shard balance')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='core.adminwallet', verbose_name='Admin wallet')),
+            ],
+            options={
+                'unique_together': {('wallet', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:09
+
+from decimal import MAX_EMAX, MAX_PREC, MIN_EMIN, ROUND_DOWN, Context
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+UNITS_CONTEXT = Context(prec=MAX_PREC, rounding=ROUND_DOWN,
+                        Emax=MAX_EMAX, Emin=MIN_EMIN)
+
+
+def fill_units(apps, schema_editor):
+    Coin = apps.get_model('core', 'Coin')
+    AdminWallet = apps.get_model('core', 'AdminWallet')
+    Transaction = apps.get_model('core', 'Transaction')
+
+    # Decimals of custom tokens are known from their admin wallets
+    for coin_id, decimal in (AdminWallet.objects
+                             .filter(wallet_address__owner_admin=True, decimal__gt=0)
+                             .values_list('wallet_address__coin_id', 'decimal')):
+        Coin.objects.filter(pk=coin_id).update(decimals=decimal)
+
+    decimals = dict(Coin.objects.values_list('pk', 'decimals'))
+    batch = []
+    for transaction in (Transaction.objects
+                        .filter(amount__isnull=False)
+                        .only('pk', 'coin_id', 'amount')
+                        .iterator(chunk_size=BATCH_SIZE)):
+        transaction.amount_units = int(
+            transaction.amount
+            .scaleb(decimals[transaction.coin_id], context=UNITS_CONTEXT)
+            .to_integral_value(context=UNITS_CONTEXT))
+        batch.append(transaction)
+        if len(batch) == BATCH_SIZE:
+            Transaction.objects.bulk_update(batch, ['amount_units'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['amount_units'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_adminwalletshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coin',
+            name='decimals',
+            field=models.PositiveSmallIntegerField(default=18, verbose_name='Decimals of base units'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='amount_units',
+            field=models.DecimalField(blank=True, decimal_places=0, editable=False, max_digits=78, null=True, verbose_name='Transaction amount in base units'),
+        ),
+        migrations.RunPython(fill_units, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_coin_decimals_transaction_amount_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionRollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('category', models.CharField(choices=[('fill_reserve', 'Fill up of admin wallet'), ('takeoff_reserve', 'Takeoff from admin wallet'), ('referals', 'Referal bonuses'), ('akv_income', 'Platform commission')], max_length=32, verbose_name='Transactions category')),
+                ('count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=50, default=0, max_digits=100, verbose_name='Change of sum of transactions amounts')),
+                ('coin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.coin', verbose_name='Transactions coin')),
+            ],
+        ),
+    ]
@@ -1,5 +1,7 @@
+from types import SimpleNamespace
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from config.settings import AUTH_USER_MODEL
 
 # User = get_user_model()
@@ -18,6 +20,12 @@ class Coin(models.Model):
     cost_in_busd = models.DecimalField(null=True, blank=True, max_digits=100,
                                        decimal_places=50,
                                        verbose_name='BUSD cost')
+    price_source = models.CharField(max_length=16, null=True, blank=True,
+                                    verbose_name='Source of BUSD cost')
+    price_updated_at = models.DateTimeField(null=True, blank=True,
+                                            verbose_name='BUSD cost update time')
+    decimals = models.PositiveSmallIntegerField(default=18,
+                                                verbose_name='Decimals of base units')
 
     def __str__(self):
         return self.name
@@ -66,6 +74,25 @@ class AdminWallet(models.Model):
         return self.wallet_address.address
 
 
+class AdminWalletShard(models.Model):
+    """Part of admin wallet balance. Balance of wallet is its own balance
+       plus balances of all its shards, parallel changes of balance are
+       spread over shards rows (see core.shards)."""
+
+    wallet = models.ForeignKey(AdminWallet, on_delete=models.CASCADE,
+                               related_name='shards',
+                               verbose_name='Admin wallet')
+    shard = models.PositiveSmallIntegerField(verbose_name='Shard number')
+    balance = models.DecimalField(default=0, max_digits=100, decimal_places=50,
+                                  verbose_name='Shard balance')
+
+    class Meta:
+        unique_together = ('wallet', 'shard')
+
+    def __str__(self):
+        return f'{self.wallet} #{self.shard}'
+
+
 class Exchange(models.Model):
     """Model of exchange."""
 
@@ -94,6 +121,10 @@ class Transaction(models.Model):
     amount = models.DecimalField(null=True, blank=True, max_digits=100,
                                  decimal_places=50,
                                  verbose_name='Transaction amount (volume)')
+    # Amount in base units of coin (see core.units), 78 digits fit uint256
+    amount_units = models.DecimalField(null=True, blank=True, max_digits=78,
+                                       decimal_places=0, editable=False,
+                                       verbose_name='Transaction amount in base units')
     commission = models.BooleanField(default=False)
     referal = models.BooleanField(default=False)
     received = models.BooleanField(default=False)
@@ -101,3 +132,95 @@ class Transaction(models.Model):
     fill_up = models.BooleanField(default=False)
 
     date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Indexes for filters of views and admin reports. Flags are sparse,
+        # so transactions with flag are indexed by partial indexes.
+        indexes = [
+            models.Index(fields=['address_to', 'coin']),
+            models.Index(fields=['address_from', 'coin', 'date']),
+            models.Index(fields=['address_to', 'date'],
+                         condition=models.Q(referal=True),
+                         name='transaction_referal_to_idx'),
+            models.Index(fields=['coin', 'date'],
+                         condition=models.Q(referal=True),
+                         name='transaction_referal_coin_idx'),
+            models.Index(fields=['coin', 'date'],
+                         condition=models.Q(commission=True),
+                         name='transaction_commission_idx'),
+            models.Index(fields=['address_to', 'coin', 'date'],
+                         condition=models.Q(fill_up=True),
+                         name='transaction_fill_up_idx'),
+        ]
+
+    # Fields which define place of transaction in rollup (see core.rollup)
+    ROLLUP_FIELDS = ('date', 'coin_id', 'amount_units', 'address_from_id',
+                     'address_to_id', 'fill_up', 'received', 'referal',
+                     'commission')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # State loaded from db is moved out of rollup on save of changes
+        if set(cls.ROLLUP_FIELDS) <= set(field_names):
+            instance.remember_rollup_state()
+        return instance
+
+    def remember_rollup_state(self, state: dict = None):
+        if state is None:
+            state = {name: getattr(self, name) for name in self.ROLLUP_FIELDS}
+        self._rollup_state = SimpleNamespace(**state)
+
+    def save(self, *args, **kwargs):
+        # Rollup deltas are written by post_save signal in the same db transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class TransactionRollup(models.Model):
+    """Model of daily sums of transactions by coin and category."""
+
+    CATEGORIES = (
+        ('fill_reserve', 'Fill up of admin wallet'),
+        ('takeoff_reserve', 'Takeoff from admin wallet'),
+        ('referals', 'Referal bonuses'),
+        ('akv_income', 'Platform commission'),
+    )
+
+    day = models.DateField(verbose_name='Day')
+    coin = models.ForeignKey(Coin,
+                             on_delete=models.CASCADE,
+                             verbose_name='Transactions coin')
+    category = models.CharField(max_length=32, choices=CATEGORIES,
+                                verbose_name='Transactions category')
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=100, decimal_places=50, default=0,
+                                 verbose_name='Sum of transactions amounts')
+
+    class Meta:
+        unique_together = ('day', 'coin', 'category')
+        indexes = [
+            models.Index(fields=['coin', 'category', 'day']),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.coin} {self.category}'
+
+
+class TransactionRollupDelta(models.Model):
+    """Model of change of daily rollup by written transactions,
+       deltas are folded into TransactionRollup by a periodic task."""
+
+    day = models.DateField(verbose_name='Day')
+    coin = models.ForeignKey(Coin,
+                             on_delete=models.CASCADE,
+                             verbose_name='Transactions coin')
+    category = models.CharField(max_length=32,
+                                choices=TransactionRollup.CATEGORIES,
+                                verbose_name='Transactions category')
+    count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=100, decimal_places=50, default=0,
+                                 verbose_name='Change of sum of transactions amounts')
+
+    def __str__(self):
+        return f'{self.day} {self.coin} {self.category} {self.count:+}'
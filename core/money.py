@@ -0,0 +1,74 @@
+"""
+Money math in explicit decimal contexts. Functions don't read or change
+decimal context of current thread, so results don't depend on order of
+calls and they may be called from threads. Amounts are computed with
+MONEY_PREC significant digits and rounded down to decimals of coin,
+as they are sent on chain. Functions taking lists compute all amounts
+in one pass.
+"""
+from decimal import ROUND_HALF_EVEN, Context, Decimal, localcontext
+
+from .units import UNITS_CONTEXT, from_units, to_units
+
+
+# Fields of amounts keep 50 decimal places
+MONEY_PREC = 50
+
+MONEY_CONTEXT = Context(prec=MONEY_PREC, rounding=ROUND_HALF_EVEN)
+
+
+def money_context():
+    """Context of money math: `with money_context(): ...`."""
+    return localcontext(MONEY_CONTEXT)
+
+
+def to_decimal(value) -> Decimal:
+    """Decimal from Decimal, int or float (exactly)."""
+    return value if isinstance(value, Decimal) else Decimal(value)
+
+
+def round_amount(amount, decimals: int) -> Decimal:
+    """Amount rounded down to decimals of coin."""
+    return from_units(to_units(amount, decimals), decimals)
+
+
+def round_amounts(amounts, decimals: int) -> list:
+    return [round_amount(amount, decimals) for amount in amounts]
+
+
+def parts(amount, rates, decimals: int) -> list:
+    """Parts of amount by rates (percents as fractions) rounded down
+       to decimals of coin."""
+    amount = to_decimal(amount)
+    with money_context():
+        return [round_amount(amount * to_decimal(rate), decimals) for rate in rates]
+
+
+def _integers(values) -> list:
+    """Decimals scaled to integers by one common power of ten."""
+    values = [to_decimal(value) for value in values]
+    exponent = min(value.as_tuple().exponent for value in values)
+    return [int(value.scaleb(-exponent, context=UNITS_CONTEXT)) for value in values]
+
+
+def split(amount, weights, decimals: int) -> list:
+    """Split amount proportionally to weights (like allocations).
+       Shares are rounded down to decimals of coin and units left after
+       rounding are given to shares with the largest remainders, so sum
+       of shares is amount rounded down. Counted on integers, exactly."""
+    weights = list(weights)
+    units = to_units(amount, decimals)
+    if not weights:
+        return []
+    weights = _integers(weights)
+    total = sum(weights)
+    if not total or units <= 0:
+        return [from_units(0, decimals)] * len(weights)
+
+    shares, remainders = zip(*(divmod(units * weight, total) for weight in weights))
+    shares = list(shares)
+    left = units - sum(shares)
+    for index in sorted(range(len(shares)), key=remainders.__getitem__,
+                        reverse=True)[:left]:
+        shares[index] += 1
+    return [from_units(share, decimals) for share in shares]
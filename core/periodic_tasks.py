@@ -1,4 +1,4 @@
-﻿from .tasks import scan_admin_wallets, retreive_coins_cost
+﻿from .tasks import fold_transaction_rollup, scan_admin_wallets, retreive_coins_cost
 
 
 def periodically_run_job():
@@ -9,3 +9,8 @@ def periodically_run_job():
 def periodically_run_job_2():
     print('Scan coins cost')
     retreive_coins_cost.send()
+
+
+def periodically_run_job_3():
+    print('Fold transactions rollup')
+    fold_transaction_rollup.send()
@@ -0,0 +1,51 @@
+from django.db.models import Q
+
+from .models import Transaction
+from .prices import get_prices
+from .units import SumUnits, from_units
+
+
+def _empty_position(coin_name: str) -> dict:
+    return {'coin': coin_name, 'received': 0, 'available': 0, 'total': 0}
+
+
+def retrieve_portfolio(address, coins=None) -> dict:
+    """Tokens sent to address by coins in one grouped query:
+       received (taken off) and available (not taken off yet) visible
+       tokens, total of all tokens and its cost in BUSD by cached price.
+       Returns {coin_id: position}, coins without transactions are
+       included with zero amounts if they are passed in `coins`."""
+    transactions = Transaction.objects.filter(address_to=address)
+    if coins is not None:
+        transactions = transactions.filter(coin__in=coins)
+
+    # Amounts are summed by db in base units of coin
+    rows = (transactions
+            .order_by()
+            .values('coin_id', 'coin__name', 'coin__decimals')
+            .annotate(received_sum=SumUnits('amount_units',
+                                       filter=Q(received=True, visible=True)),
+                      available_sum=SumUnits('amount_units',
+                                        filter=Q(received=False, visible=True)),
+                      total_sum=SumUnits('amount_units')))
+
+    portfolio = {coin.pk: _empty_position(coin.name) for coin in coins or ()}
+    for row in rows:
+        position = _empty_position(row['coin__name'])
+        position.update({key: from_units(row[f'{key}_sum'] or 0,
+                                         row['coin__decimals'])
+                         for key in ('received', 'available', 'total')})
+        portfolio[row['coin_id']] = position
+
+    prices = get_prices({position['coin'] for position in portfolio.values()})
+    for position in portfolio.values():
+        price = prices[position['coin']]
+        position['in_busd'] = position['total'] * price.cost if price.cost else 0
+        position['price_updated_at'] = price.fetched_at
+        position['price_stale'] = price.stale
+    return portfolio
+
+
+def portfolio_in_busd(portfolio: dict):
+    """Cost of all tokens of portfolio in BUSD."""
+    return sum(position['in_busd'] for position in portfolio.values())
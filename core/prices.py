@@ -0,0 +1,250 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .clients import CoinGeckoClient, PancakeSwapClient
+from .exceptions import StalePriceError
+from .models import Coin
+from .money import money_context
+
+
+SYMBOLS_INDEX_KEY = 'coingecko:symbols'
+# CoinGecko coins list (~13k coins) changes rarely
+SYMBOLS_INDEX_TIMEOUT = 60 * 60 * 24
+
+COINGECKO = 'coingecko'
+PANCAKESWAP = 'pancakeswap'
+
+# Prices are shared between processes in cache and kept in memory of every
+# process for a few seconds, db is used only if shared cache is empty
+PRICE_TIMEOUT = 60 * 60
+LOCAL_PRICE_TIMEOUT = 5
+
+# Prices are refreshed every 30 seconds, older ones are stale by default
+MAX_STALENESS = timedelta(minutes=10)
+
+coingecko = CoinGeckoClient()
+pancakeswap = PancakeSwapClient()
+
+_local_prices = {}
+_local_lock = threading.Lock()
+
+
+class CoinPrice(NamedTuple):
+    """Cost of coin in BUSD with its source and time of fetching."""
+    cost: Optional[Decimal]
+    source: Optional[str] = None
+    fetched_at: Optional[object] = None
+    stale: bool = True
+
+
+def _price_key(name: str) -> str:
+    return f'price:{name}'
+
+
+def _coin_name(coin) -> str:
+    return coin if isinstance(coin, str) else coin.name
+
+
+def _is_stale(fetched_at, max_staleness: timedelta) -> bool:
+    if fetched_at is None:
+        return True
+    return timezone.now() - fetched_at > max_staleness
+
+
+def _remember_local(prices: dict):
+    expires = time.monotonic() + LOCAL_PRICE_TIMEOUT
+    with _local_lock:
+        for name, price in prices.items():
+            _local_prices[name] = (expires, price)
+
+
+def _load_prices(names) -> dict:
+    """Raw prices {name: (cost, source, fetched_at)} from memory of process,
+       shared cache or db (in that order)."""
+    now = time.monotonic()
+    prices = {}
+    with _local_lock:
+        for name in names:
+            expires, price = _local_prices.get(name, (0, None))
+            if expires > now:
+                prices[name] = price
+
+    missing = [name for name in names if name not in prices]
+    if missing:
+        cached = cache.get_many([_price_key(name) for name in missing])
+        shared = {name: cached[_price_key(name)] for name in missing
+                  if _price_key(name) in cached}
+
+        from_db = {name: (cost, source, fetched_at)
+                   for name, cost, source, fetched_at in Coin.objects
+                   .filter(name__in=[n for n in missing if n not in shared])
+                   .values_list('name', 'cost_in_busd', 'price_source',
+                                'price_updated_at')}
+        if from_db:
+            cache.set_many({_price_key(name): price
+                            for name, price in from_db.items()},
+                           timeout=PRICE_TIMEOUT)
+
+        shared.update(from_db)
+        _remember_local(shared)
+        prices.update(shared)
+    return prices
+
+
+def get_prices(coins, max_staleness: timedelta = MAX_STALENESS) -> dict:
+    """Prices of coins (Coin objects or names): {name: CoinPrice}.
+       Price is flagged as stale if it was fetched earlier than
+       `max_staleness` ago."""
+    names = [_coin_name(coin) for coin in coins]
+    prices = _load_prices(names)
+
+    result = {}
+    for name in names:
+        cost, source, fetched_at = prices.get(name, (None, None, None))
+        result[name] = CoinPrice(cost, source, fetched_at,
+                                 _is_stale(fetched_at, max_staleness))
+    return result
+
+
+def get_price(coin, max_staleness: timedelta = MAX_STALENESS) -> CoinPrice:
+    """Price of one coin (Coin object or name), see get_prices."""
+    return get_prices([coin], max_staleness)[_coin_name(coin)]
+
+
+def get_fresh_price(coin, max_staleness: timedelta = MAX_STALENESS) -> Decimal:
+    """Cost of coin for money operations, StalePriceError is raised
+       if price is unknown or stale."""
+    price = get_price(coin, max_staleness)
+    if price.cost is None or price.stale:
+        raise StalePriceError(
+            f'Курс монеты {_coin_name(coin)} устарел, повторите позже.')
+    return price.cost
+
+
+def store_prices(coins):
+    """Save costs of coins with their metadata to db by one query
+       and share them with other processes."""
+    Coin.objects.bulk_update(coins, ['cost_in_busd', 'price_source',
+                                     'price_updated_at'])
+    prices = {coin.name: (coin.cost_in_busd, coin.price_source,
+                          coin.price_updated_at)
+              for coin in coins}
+    cache.set_many({_price_key(name): price for name, price in prices.items()},
+                   timeout=PRICE_TIMEOUT)
+    _remember_local(prices)
+
+
+def drop_prices(names):
+    """Forget cached prices of coins (on manual change of coins)."""
+    cache.delete_many([_price_key(name) for name in names])
+    with _local_lock:
+        for name in names:
+            _local_prices.pop(name, None)
+
+
+def build_symbols_index(coins_list: list) -> dict:
+    """Index of CoinGecko coins list: {symbol: [coin_id, ...]}."""
+    index = defaultdict(list)
+    for cg_coin in coins_list:
+        index[cg_coin['symbol'].lower()].append(cg_coin['id'])
+    return dict(index)
+
+
+def get_symbols_index(refresh: bool = False) -> dict:
+    """Cached index of CoinGecko coins by symbol, coins list is downloaded
+       only if index is expired."""
+    index = None if refresh else cache.get(SYMBOLS_INDEX_KEY)
+    if index is None:
+        index = build_symbols_index(coingecko.get_coins_list())
+        cache.set(SYMBOLS_INDEX_KEY, index, timeout=SYMBOLS_INDEX_TIMEOUT)
+    return index
+
+
+def retrieve_coingecko_prices(symbols) -> dict:
+    """Prices in usd of coins by symbols with one request.
+       If few CoinGecko coins have the same symbol, the last one with price
+       is taken. Returns {symbol: Decimal}."""
+    index = get_symbols_index()
+    ids = {symbol: index.get(symbol.lower(), []) for symbol in symbols}
+    all_ids = sorted({coin_id for coin_ids in ids.values() for coin_id in coin_ids})
+    if not all_ids:
+        return {}
+
+    # {'binance-usd': {'usd': 1.001}, ...}
+    data = coingecko.get_price(ids=all_ids, vs_currencies='usd')
+    prices = {}
+    for symbol, coin_ids in ids.items():
+        for coin_id in coin_ids:
+            if data.get(coin_id, {}).get('usd') is not None:
+                prices[symbol] = Decimal(str(data[coin_id]['usd']))
+    return prices
+
+
+def retrieve_pancakeswap_prices(symbols) -> dict:
+    """Prices of tokens by symbols from one PancakeSwap tokens list.
+       Returns {symbol: Decimal}."""
+    tokens = {}
+    for values in pancakeswap.get_tokens().values():
+        tokens.setdefault(values['symbol'].upper(), values)
+
+    prices = {}
+    for symbol in symbols:
+        token = tokens.get('WBNB' if symbol.upper() == 'BNB' else symbol.upper())
+        if token and token.get('price'):
+            prices[symbol] = Decimal(token['price'])
+    return prices
+
+
+def refresh_coins_cost() -> dict:
+    """Update cost in BUSD of all coins: prices from CoinGecko,
+       coins not found there - from PancakeSwap. Returns {coin name: cost}."""
+    coins = {coin.name: coin for coin in Coin.objects.all()}
+    busd = coins.get('BUSD')
+    if busd is None:
+        print('BUSD coin not found')
+        return {}
+
+    prices, sources = {}, {}
+    try:
+        prices = retrieve_coingecko_prices(coins)
+        sources = dict.fromkeys(prices, COINGECKO)
+    except Exception as e:
+        print('CoinGecko error', e)
+
+    missing = [name for name in coins if name not in prices]
+    if missing:
+        try:
+            pcs_prices = retrieve_pancakeswap_prices(missing)
+            prices.update(pcs_prices)
+            sources.update(dict.fromkeys(pcs_prices, PANCAKESWAP))
+        except Exception as e:
+            print('PancakeSwap error', e)
+
+    fetched_at = timezone.now()
+    changed = []
+    with money_context():
+        if 'BUSD' in prices:
+            busd.cost_in_busd = prices['BUSD']
+            changed.append(busd)
+
+        if busd.cost_in_busd:
+            for name, coin in coins.items():
+                if name != 'BUSD' and name in prices:
+                    coin.cost_in_busd = prices[name] * busd.cost_in_busd
+                    changed.append(coin)
+
+    for coin in changed:
+        coin.price_source = sources[coin.name]
+        coin.price_updated_at = fetched_at
+    store_prices(changed)
+
+    costs = {coin.name: coin.cost_in_busd for coin in changed}
+    print(f'Coins cost updated: {costs}')
+    return costs
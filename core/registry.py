@@ -0,0 +1,165 @@
+"""
+In-process registry of coins, admin wallets and IDOs of coins. They change
+rarely, so registry is built by few queries once and kept in memory of
+process. Every change of them bumps shared version in cache, processes
+check version not more often than once in VERSION_CHECK_INTERVAL seconds
+and rebuild registry if it is changed.
+
+Objects of registry are shared between threads: they must not be changed
+or saved, and their counters (balances, allocations, prices) are stale,
+such values are read from db.
+"""
+import copy
+import threading
+import time
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from ido.models import IDO
+
+from .models import AdminWallet, Coin
+
+
+REGISTRY_VERSION_KEY = 'registry:version'
+VERSION_CHECK_INTERVAL = 1
+
+MAIN_COIN = 'BUSD'
+MAIN_NETWORK = 'BEP20'
+
+
+class Registry(NamedTuple):
+    version: int
+    coins: dict           # {name: Coin}
+    decimals: dict        # {coin_id: decimals}
+    admin_wallets: dict   # {coin_id: AdminWallet}
+    idos: dict            # {coin_id: IDO}
+    addresses: frozenset  # ids of admin and smartcontracts addresses
+
+
+_local = {'registry': None, 'checked': 0}
+_local_lock = threading.Lock()
+
+
+def _registry_version() -> int:
+    cache.add(REGISTRY_VERSION_KEY, 1, timeout=None)
+    return cache.get(REGISTRY_VERSION_KEY, 1)
+
+
+def build_registry(version: int) -> Registry:
+    coins = {coin.name: coin for coin in Coin.objects.all()}
+    by_id = {coin.pk: coin for coin in coins.values()}
+    decimals = {coin.pk: coin.decimals for coin in coins.values()}
+
+    admin_wallets = {}
+    for wallet in (AdminWallet.objects
+                   .filter(wallet_address__owner_admin=True)
+                   .select_related('wallet_address')
+                   .order_by('pk')):
+        wallet.wallet_address.coin = by_id[wallet.wallet_address.coin_id]
+        admin_wallets.setdefault(wallet.wallet_address.coin_id, wallet)
+
+    idos = {}
+    for ido in IDO.objects.select_related('smartcontract').order_by('pk'):
+        ido.coin = by_id.get(ido.coin_id)
+        if ido.smartcontract is not None:
+            ido.smartcontract.coin = by_id[ido.smartcontract.coin_id]
+        idos.setdefault(ido.coin_id, ido)
+
+    addresses = frozenset(
+        [wallet.wallet_address_id for wallet in admin_wallets.values()]
+        + [ido.smartcontract_id for ido in idos.values() if ido.smartcontract_id])
+    return Registry(version, coins, decimals, admin_wallets, idos, addresses)
+
+
+def get_registry() -> Registry:
+    """Registry of process, rebuilt if it was changed in any process."""
+    now = time.monotonic()
+    with _local_lock:
+        registry, checked = _local['registry'], _local['checked']
+    if registry is not None and now - checked < VERSION_CHECK_INTERVAL:
+        return registry
+
+    version = _registry_version()
+    if registry is None or registry.version != version:
+        registry = build_registry(version)
+    with _local_lock:
+        _local['registry'], _local['checked'] = registry, now
+    return registry
+
+
+def _drop_registry():
+    try:
+        cache.incr(REGISTRY_VERSION_KEY)
+    except ValueError:
+        cache.add(REGISTRY_VERSION_KEY, 1, timeout=None)
+    with _local_lock:
+        _local['registry'] = None
+
+
+def invalidate_registry():
+    """Rebuild registry in all processes after commit of current changes
+       (on change of coins, admin wallets and IDOs)."""
+    transaction.on_commit(_drop_registry)
+
+
+def is_registered_address(address) -> bool:
+    """Address is admin or smartcontract address kept in registry."""
+    return address.owner_admin or address.pk in get_registry().addresses
+
+
+def _coin_id(coin) -> int:
+    return coin if isinstance(coin, int) else coin.pk
+
+
+def get_coin(name: str) -> Coin:
+    try:
+        return get_registry().coins[name]
+    except KeyError:
+        raise Coin.DoesNotExist(f'Coin {name} does not exist.')
+
+
+def get_main_coin() -> Coin:
+    """BUSD coin, it is created if doesn't exist."""
+    coin = get_registry().coins.get(MAIN_COIN)
+    if coin is None:
+        coin, _ = Coin.objects.get_or_create(name=MAIN_COIN, network=MAIN_NETWORK)
+    return coin
+
+
+def get_admin_wallet(coin) -> AdminWallet:
+    """Admin wallet of coin (Coin object or id)."""
+    try:
+        return get_registry().admin_wallets[_coin_id(coin)]
+    except KeyError:
+        raise AdminWallet.DoesNotExist(f'Admin wallet of coin {coin} does not exist.')
+
+
+def get_coin_ido(coin) -> IDO:
+    """IDO of coin (Coin object or id) with its smartcontract."""
+    try:
+        return get_registry().idos[_coin_id(coin)]
+    except KeyError:
+        raise IDO.DoesNotExist(f'IDO of coin {coin} does not exist.')
+
+
+def get_custom_admin_wallets() -> list:
+    """Admin wallets of all coins except BUSD with balances from db.
+       Wallets are copies, so they may be changed and saved."""
+    registry = get_registry()
+    main_coin = registry.coins.get(MAIN_COIN)
+    wallets = [wallet for coin_id, wallet in registry.admin_wallets.items()
+               if main_coin is None or coin_id != main_coin.pk]
+    balances = dict(AdminWallet.objects
+                    .filter(pk__in=[wallet.pk for wallet in wallets])
+                    .values_list('pk', 'balance'))
+
+    result = []
+    for wallet in wallets:
+        if wallet.pk not in balances:
+            continue
+        wallet = copy.copy(wallet)
+        wallet.balance = balances[wallet.pk]
+        result.append(wallet)
+    return result
@@ -0,0 +1,205 @@
+"""
+Daily rollup of transactions: count and sum of amounts for every
+(day, coin, category). Writers of transactions only append delta rows
+(TransactionRollupDelta) in the same db transaction, so they don't wait
+for locks of shared rollup rows. Deltas are folded into TransactionRollup
+by fold_rollup (fold_transaction_rollup task), reports read rollup rows
+together with deltas not folded yet. Full recompute is done only by
+rebuild_rollup (rebuild_transaction_rollup command).
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import Address, Transaction, TransactionRollup, TransactionRollupDelta
+from .units import SumUnits, coin_decimals, from_units
+
+
+CATEGORIES = {
+    'fill_reserve': Q(fill_up=True, address_to__owner_admin=True,
+                      address_to__coin=F('coin')),
+    'takeoff_reserve': Q(received=True, address_from__owner_admin=True,
+                         address_from__coin=F('coin')),
+    'referals': Q(referal=True),
+    'akv_income': Q(commission=True),
+}
+
+BATCH_SIZE = 1000
+
+
+def _aggregates() -> dict:
+    aggregates = {}
+    for category, condition in CATEGORIES.items():
+        aggregates[f'{category}__count'] = Count('id', filter=condition)
+        aggregates[f'{category}__amount'] = SumUnits('amount_units', filter=condition)
+    return aggregates
+
+
+def _rollup_rows(day, coin_id: int, sums: dict) -> list:
+    decimals = coin_decimals(coin_id)
+    rows = []
+    for category in CATEGORIES:
+        count = sums[f'{category}__count']
+        if count:
+            rows.append(TransactionRollup(day=day, coin_id=coin_id,
+                                          category=category, count=count,
+                                          amount=from_units(sums[f'{category}__amount'] or 0,
+                                                            decimals)))
+    return rows
+
+
+def _grouped_sums(transactions):
+    """Counts and sums of categories of transactions by (day, coin)."""
+    return (transactions
+            .annotate(day=TruncDay('date'))
+            .order_by()
+            .values('day', 'coin_id')
+            .annotate(**_aggregates()))
+
+
+def _admin_addresses(transactions) -> dict:
+    """Coins of admin addresses of transactions: {address_id: coin_id}."""
+    ids = ({trans.address_from_id for trans in transactions}
+           | {trans.address_to_id for trans in transactions})
+    return dict(Address.objects
+                .filter(pk__in=ids, owner_admin=True)
+                .values_list('pk', 'coin_id'))
+
+
+def _categories(trans, admin_addresses: dict) -> list:
+    """Categories of transaction, the same as CATEGORIES conditions."""
+    categories = []
+    if trans.fill_up and admin_addresses.get(trans.address_to_id) == trans.coin_id:
+        categories.append('fill_reserve')
+    if trans.received and admin_addresses.get(trans.address_from_id) == trans.coin_id:
+        categories.append('takeoff_reserve')
+    if trans.referal:
+        categories.append('referals')
+    if trans.commission:
+        categories.append('akv_income')
+    return categories
+
+
+def _add_deltas(deltas: dict, transactions, sign: int):
+    admin_addresses = _admin_addresses(transactions)
+    for trans in transactions:
+        if trans.date is None:
+            continue
+        day = timezone.localtime(trans.date).date()
+        for category in _categories(trans, admin_addresses):
+            delta = deltas[(day, trans.coin_id, category)]
+            delta[0] += sign
+            delta[1] += sign * (trans.amount_units or 0)
+
+
+def _apply_deltas(deltas: dict):
+    """Append {(day, coin_id, category): [count, units]} as delta rows."""
+    TransactionRollupDelta.objects.bulk_create(
+        [TransactionRollupDelta(day=day, coin_id=coin_id, category=category,
+                                count=count,
+                                amount=from_units(units, coin_decimals(coin_id)))
+         for (day, coin_id, category), (count, units) in deltas.items()
+         if count or units])
+
+
+def _fold_sums(sums: dict):
+    """Add {(day, coin_id, category): [count, amount]} to rollup rows."""
+    # Missing rows are created empty, then every row is changed by one UPDATE
+    TransactionRollup.objects.bulk_create(
+        [TransactionRollup(day=day, coin_id=coin_id, category=category)
+         for day, coin_id, category in sums],
+        ignore_conflicts=True)
+    emptied = Q(pk__in=[])
+    for (day, coin_id, category), (count, amount) in sums.items():
+        row = Q(day=day, coin_id=coin_id, category=category)
+        (TransactionRollup.objects
+         .filter(row)
+         .update(count=F('count') + count, amount=F('amount') + amount))
+        if count < 0:
+            emptied |= row
+    TransactionRollup.objects.filter(emptied, count=0).delete()
+
+
+def fold_rollup(batch_size: int = BATCH_SIZE) -> int:
+    """Fold delta rows into rollup rows by batches, deltas locked by
+       parallel fold are skipped. Returns count of folded deltas."""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            deltas = list(TransactionRollupDelta.objects
+                          .select_for_update(skip_locked=True)
+                          .order_by('pk')[:batch_size])
+            sums = defaultdict(lambda: [0, 0])
+            for delta in deltas:
+                total = sums[(delta.day, delta.coin_id, delta.category)]
+                total[0] += delta.count
+                total[1] += delta.amount
+            sums = {key: total for key, total in sums.items() if any(total)}
+            if sums:
+                _fold_sums(sums)
+            TransactionRollupDelta.objects.filter(
+                pk__in=[delta.pk for delta in deltas]).delete()
+        folded += len(deltas)
+        if len(deltas) < batch_size:
+            return folded
+
+
+def add_to_rollup(transactions):
+    """Add new transactions to rollup, must be called in db transaction
+       of their writing."""
+    deltas = defaultdict(lambda: [0, 0])
+    _add_deltas(deltas, transactions, 1)
+    _apply_deltas(deltas)
+
+
+def change_in_rollup(old, new):
+    """Move changed transaction (flags, date, coin or amount) in rollup:
+       `old` is its state before save."""
+    deltas = defaultdict(lambda: [0, 0])
+    _add_deltas(deltas, [old], -1)
+    _add_deltas(deltas, [new], 1)
+    _apply_deltas(deltas)
+
+
+def delete_transactions(transactions) -> int:
+    """Delete queryset of transactions and subtract them from rollup
+       (by one grouped query) in one db transaction.
+       Returns count of deleted transactions."""
+    with transaction.atomic():
+        deltas = defaultdict(lambda: [0, 0])
+        for group in _grouped_sums(transactions):
+            day = group['day'].date()
+            for category in CATEGORIES:
+                delta = deltas[(day, group['coin_id'], category)]
+                delta[0] -= group[f'{category}__count']
+                delta[1] -= group[f'{category}__amount'] or 0
+        count, _ = transactions.delete()
+        _apply_deltas(deltas)
+    return count
+
+
+def rebuild_rollup(date_from: datetime = None, batch_size: int = BATCH_SIZE) -> int:
+    """Rebuild rollup from all transactions (or from date_from)
+       with one grouped query. Returns count of rollup rows."""
+    transactions = Transaction.objects.all()
+    rollup = TransactionRollup.objects.all()
+    deltas = TransactionRollupDelta.objects.all()
+    if date_from:
+        day_from = timezone.localtime(date_from).date()
+        transactions = transactions.filter(date__gte=date_from)
+        rollup = rollup.filter(day__gte=day_from)
+        deltas = deltas.filter(day__gte=day_from)
+
+    rows = []
+    for group in _grouped_sums(transactions).iterator():
+        rows.extend(_rollup_rows(group['day'].date(), group['coin_id'], group))
+
+    with transaction.atomic():
+        rollup.delete()
+        deltas.delete()
+        TransactionRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
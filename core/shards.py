@@ -0,0 +1,117 @@
+"""
+Sharded balance of admin wallet. Balance of wallet is AdminWallet.balance
+plus balances of its AdminWalletShard rows. Additions go to a random
+shard, so parallel fills don't wait for lock of one row. Unguarded
+takeoff is one F() decrement of wallet row. Guarded takeoff is done by
+guarded F() update of a random shard, then of wallet row, and only if
+neither has enough all rows of wallet are locked and shards are folded
+into wallet row.
+"""
+import random
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+
+from config.settings import ADMIN_WALLET_SHARDS
+
+from .models import AdminWallet, AdminWalletShard
+
+
+# Balance is read for showing, checks of takeoff are done by db
+BALANCE_TIMEOUT = 5
+
+
+def _balance_key(wallet_id) -> str:
+    return f'admin_wallet_balance:{wallet_id}'
+
+
+def create_shards(wallet, count: int = ADMIN_WALLET_SHARDS):
+    AdminWalletShard.objects.bulk_create(
+        [AdminWalletShard(wallet_id=wallet.pk, shard=shard)
+         for shard in range(count)],
+        ignore_conflicts=True)
+
+
+def _random_shard(wallet):
+    return AdminWalletShard.objects.filter(
+                wallet_id=wallet.pk,
+                shard=random.randrange(ADMIN_WALLET_SHARDS))
+
+
+def add_to_wallet(wallet, amount):
+    """Add amount to balance of wallet, negative amount is taken off
+       without check of balance."""
+    if amount < 0:
+        AdminWallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + amount)
+        return
+
+    if not _random_shard(wallet).update(balance=F('balance') + amount):
+        create_shards(wallet)
+        _random_shard(wallet).update(balance=F('balance') + amount)
+
+
+def _fold_wallet(wallet, amount, minimum=None) -> bool:
+    """Lock all rows of wallet, fold shards into wallet row and take off
+       amount if total balance is not less than `minimum` (no check if None)."""
+    with transaction.atomic():
+        locked = AdminWallet.objects.select_for_update().get(pk=wallet.pk)
+        shards = (AdminWalletShard.objects
+                  .select_for_update()
+                  .filter(wallet_id=wallet.pk))
+        total = (locked.balance or 0) + sum(shard.balance for shard in shards)
+        if minimum is not None and total < minimum:
+            return False
+
+        shards.update(balance=0)
+        AdminWallet.objects.filter(pk=wallet.pk).update(balance=total - amount)
+    cache.delete(_balance_key(wallet.pk))
+    return True
+
+
+def take_from_wallet(wallet, amount, minimum=None) -> bool:
+    """Take off amount from balance of wallet if it is not less than
+       `minimum` (amount by default). Returns False if balance is less."""
+    minimum = amount if minimum is None else minimum
+    enough = max(amount, minimum)
+    if (AdminWalletShard.objects
+            # Shards never go below zero, wallet row may go only
+            # by unguarded takeoff
+            .filter(wallet_id=wallet.pk,
+                    shard=random.randrange(ADMIN_WALLET_SHARDS),
+                    balance__gte=enough,
+                    wallet__balance__gte=0)
+            .update(balance=F('balance') - amount)):
+        return True
+
+    if (AdminWallet.objects
+            .filter(pk=wallet.pk, balance__gte=enough)
+            .update(balance=F('balance') - amount)):
+        return True
+
+    return _fold_wallet(wallet, amount, minimum)
+
+
+def consolidate_wallet(wallet):
+    """Fold balances of shards into wallet row."""
+    _fold_wallet(wallet, 0)
+
+
+def count_wallet_balance(wallet):
+    """Balance of wallet with its shards by one query."""
+    balance, shards = (AdminWallet.objects
+                       .filter(pk=wallet.pk)
+                       .annotate(shards_balance=Sum('shards__balance'))
+                       .values_list('balance', 'shards_balance')
+                       .get())
+    return (balance or 0) + (shards or 0)
+
+
+def wallet_balance(wallet):
+    """Balance of wallet cached for a few seconds."""
+    key = _balance_key(wallet.pk)
+    balance = cache.get(key)
+    if balance is None:
+        balance = count_wallet_balance(wallet)
+        cache.set(key, balance, timeout=BALANCE_TIMEOUT)
+    return balance
@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from account.signals import inviters_changed
+from administrator.models import VIPUser
+from ido.models import IDO
+
+from .distribution import invalidate_payout_plans
+from .models import Address, AdminWallet, Coin, MetamaskWallet, Transaction
+from .prices import drop_prices
+from .registry import invalidate_registry, is_registered_address
+from .rollup import add_to_rollup, change_in_rollup
+from .units import fill_units
+
+
+@receiver(post_save, sender=VIPUser)
+@receiver(post_delete, sender=VIPUser)
+@receiver(post_save, sender=MetamaskWallet)
+@receiver(post_delete, sender=MetamaskWallet)
+@receiver(inviters_changed)
+def drop_payout_plans(sender, **kwargs):
+    invalidate_payout_plans()
+
+
+@receiver(post_save, sender=Coin)
+@receiver(post_delete, sender=Coin)
+def drop_coin_price(sender, instance, **kwargs):
+    drop_prices([instance.name])
+
+
+@receiver(post_save, sender=Coin)
+@receiver(post_delete, sender=Coin)
+@receiver(post_delete, sender=AdminWallet)
+@receiver(post_save, sender=IDO)
+@receiver(post_delete, sender=IDO)
+def drop_registry(sender, **kwargs):
+    invalidate_registry()
+
+
+@receiver(post_save, sender=AdminWallet)
+def drop_registry_wallet(sender, update_fields=None, **kwargs):
+    # Balances are not kept in registry
+    if update_fields is None or set(update_fields) != {'balance'}:
+        invalidate_registry()
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def drop_registry_address(sender, instance, **kwargs):
+    if is_registered_address(instance):
+        invalidate_registry()
+
+
+@receiver(pre_save, sender=Transaction)
+def set_amount_units(sender, instance, **kwargs):
+    fill_units([instance])
+    # State before save is remembered on load from db (Transaction.from_db),
+    # it is read here only for instances loaded without all its fields
+    if not instance._state.adding and not hasattr(instance, '_rollup_state'):
+        state = (Transaction.objects
+                 .filter(pk=instance.pk)
+                 .values(*Transaction.ROLLUP_FIELDS)
+                 .first())
+        if state is not None:
+            instance.remember_rollup_state(state)
+
+
+# Transactions are deleted by core.rollup.delete_transactions, there is no
+# post_delete receiver, so deletes of querysets stay fast
+@receiver(post_save, sender=Transaction)
+def update_rollup(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_rollup_state', None)
+    if old is None:
+        add_to_rollup([instance])
+    else:
+        change_in_rollup(old, instance)
+    instance.remember_rollup_state()
@@ -1,4 +1,4 @@
-﻿from decimal import Decimal, getcontext
+﻿from decimal import Decimal
 import os
 from pprint import pprint
 import requests
@@ -8,17 +8,22 @@ import json
 import sys
 
 import dramatiq
+from django.db import transaction as db_transaction
 from core.models import Coin
 
-from core.services import (get_custom_admin_wallets,
-                           divide, fill_admin_custom_wallet, distribute_tokens)
+from core.services import divide, fill_admin_custom_wallet, distribute_tokens
 
-from config.settings import COINMARKETCAP_API_KEY, ETHERSCAN_API
+from config.settings import COINMARKETCAP_API_KEY, SCAN_WORKERS
+
+from core.clients import EtherscanClient
+from core.balances import change_admin_wallet
+from core.money import money_context
+from core.exceptions import StalePriceError
+from core.prices import get_fresh_price, refresh_coins_cost
+from core.registry import get_coin_ido, get_custom_admin_wallets
+from core.rollup import fold_rollup
+from core.shards import count_wallet_balance
 
-from pycoingecko import CoinGeckoAPI
-# from pythonpancakes import PancakeSwapAPI
-import defi.defi_tools as dft
-from decimal import getcontext, Decimal
 import time
 
 from ido.models import IDO
@@ -28,6 +33,8 @@ from ido.models import IDO
 Run dramatiq workers - "python3 manage.py rundramatiq"
 """
 
+etherscan = EtherscanClient()
+
 # contract = '0x9f8f72aa9304c8b593d555f12ef6589cc3a579a2'
 # contract2= '0x57d90b64a1a57749b0f932f1a3395792e12e7055'
 # account = '0x4e83362442b8d1bec281594cea3050c8eb01311c'
@@ -36,115 +43,65 @@ Run dramatiq workers - "python3 manage.py rundramatiq"
 
 @dramatiq.actor
 def scan_admin_wallets():
-    """Regular task for scanning admin_wallets"""
-
-    admin_wallets = get_custom_admin_wallets()
-
-    for wallet in admin_wallets:
-        print(1)
-        ido = IDO.objects.get(coin=wallet.wallet_address.coin)
-        smart = ido.smartcontract
-        address = wallet.wallet_address.address
-        print(2)
-        url = f'https://api.etherscan.io/api?module=account&action=tokenbalance&contractaddress={smart}&address={address}&tag=latest&apikey={ETHERSCAN_API}'
-        response = requests.get(url)
-        data = response.json()
-        print(3)
+    """Regular task for scanning admin_wallets.
+       Balances are requested concurrently, db is updated sequentially."""
+
+    wallets = []
+    for wallet in get_custom_admin_wallets():
+        try:
+            ido = get_coin_ido(wallet.wallet_address.coin_id)
+        except IDO.DoesNotExist:
+            ido = None
+        if ido is None or ido.smartcontract is None:
+            print(f'IDO for wallet {wallet.wallet_address} not found')
+            continue
+        wallets.append((wallet, ido.smartcontract))
+
+    started = time.perf_counter()
+    balances = etherscan.token_balances(
+        [(smart.address, wallet.wallet_address.address)
+         for wallet, smart in wallets],
+        workers=SCAN_WORKERS)
+    print(f'Scanned {len(wallets)} wallets in {time.perf_counter() - started:.2f}s')
+
+    for (wallet, smart), result in zip(wallets, balances):
         # {'status': '1', 'message': 'OK', 'result': '135499'}
-        if data.get('message') == 'OK':
-            getcontext().prec = wallet.decimal
-
-            print(data.get('result'))
-            print(wallet.decimal)
-
-            tokens = divide(data.get('result'), wallet.decimal)
-            print(tokens)
-
-            # wallet.balance - in db
-            # tokens - real balance on admin wallet
-            print(repr(tokens - wallet.balance))
+        if result is None:
+            continue
 
-            if wallet.balance < tokens:
-                getcontext().prec = wallet.decimal
-                print(repr(tokens))
-                print(repr(wallet.balance))
-                diff = Decimal(tokens) - Decimal(wallet.balance)
+        tokens = divide(result, wallet.decimal)
 
+        # balance - in db (wallet row and its shards)
+        # tokens - real balance on admin wallet
+        balance = count_wallet_balance(wallet)
+        if balance < tokens:
+            try:
+                get_fresh_price(smart.coin)
+            except StalePriceError as e:
+                # Wallet is filled and distributed by the next scan
+                print(e)
+                continue
+            with money_context():
+                diff = tokens - Decimal(balance)
+
+            # Difference is added by F() update, so parallel takeoffs
+            # from wallet are not overwritten
+            with db_transaction.atomic():
                 transaction = fill_admin_custom_wallet(wallet, smart, diff)
                 distribute_tokens(wallet, smart, transaction.amount)
+                change_admin_wallet(wallet, transaction.amount)
+
 
-                wallet.balance = tokens
-                wallet.save()
+@dramatiq.actor
+def fold_transaction_rollup():
+    """Regular task for folding deltas of transactions rollup"""
+    print(f'Rollup deltas folded: {fold_rollup()}')
 
 
 @dramatiq.actor
 def retreive_coins_cost():
-    busd = Coin.objects.get(name='BUSD')
-    coins = Coin.objects.all().exclude(name='BUSD')
-    getcontext().prec = 50
-    try:
-        if busd:
-            cg = CoinGeckoAPI()
-            coins_list = cg.get_coins_list()
-            print('BUSD')
-
-            for cg_coin in coins_list:
-                if cg_coin['symbol'] == busd.name.lower():
-                    coin_id = cg_coin['id']
-                    try:
-                        busd_price = cg.get_price(ids=coin_id,
-                                                  vs_currencies='usd')
-                    except Exception as e:
-                        print(e)
-                    else:
-                        busd.cost_in_busd = Decimal(busd_price[coin_id]['usd'])
-                        busd.save()
-                        print(busd.cost_in_busd)
-
-            if coins:
-                for coin in coins:
-                    print(coin.name)
-                    # {'id': 'zyx', 'symbol': 'zyx', 'name': 'ZYX'}
-                    for cg_coin in coins_list:
-                        if cg_coin['symbol'] == coin.name.lower():
-                            coin_id = cg_coin['id']
-                            print(coin_id)
-                            try:
-                                time.sleep(2)
-                                coin_price = cg.get_price(ids=coin_id,
-                                                          vs_currencies='usd')
-                                print(coin_price)
-                            except Exception as e:
-                                print(e)
-                            else:
-                                if coin_price[coin_id]:
-                                    coin.cost_in_busd = Decimal(coin_price[coin_id]['usd']) * busd.cost_in_busd
-                                    coin.save()
-                                    coins.exclude(pk=coin.pk)
-                                    print(coin.cost_in_busd)
-    except Exception as e:
-        print(e)
-
-    if coins:
-        if not busd.cost_in_busd:
-            result_dict = dft.pcsTokenInfo(busd.name.lower())
-            print(result_dict)
-            busd.cost_in_busd = Decimal(result_dict['price'])
-            busd.save()
-            print(busd.cost_in_busd)
-        for coin in coins:
-            # {'name': 'PancakeSwap Token', 'symbol': 'Cake', 'price': '4.24055384017923644065998435584', 'price_BNB': '0.01455523752570393902803485311494'}
-            try:
-                print(coin.name)
-                result_dict = dft.pcsTokenInfo(coin.name.lower())
-                print(result_dict)
-                if result_dict:
-                    coin.cost_in_busd = Decimal(result_dict['price']) * busd.cost_in_busd
-                    time.sleep(2)
-                    coin.save()
-                    print(coin.cost_in_busd)
-            except Exception as e:
-                print('exception', e)
+    """Regular task for updating coins cost in BUSD"""
+    refresh_coins_cost()
 
     # coins = Coin.objects.all().exclude(name='BUSD')
 
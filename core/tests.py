@@ -0,0 +1,23 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from .distribution import COMMISSION, referal_percents
+from .money import parts
+
+
+class ReferalBonusesTest(SimpleTestCase):
+
+    def test_lines_bonuses_are_exact(self):
+        percents = referal_percents([1, 2, 3], {})
+        rates = [percent for _, percent in percents]
+        rates.append(COMMISSION - sum(rates))
+
+        self.assertEqual(parts(Decimal(100), rates, 18),
+                         [Decimal(6), Decimal(4), Decimal(2), Decimal(23)])
+
+    def test_vip_bonus_is_exact(self):
+        percents = referal_percents([1, 2], {2: 7.3})
+
+        self.assertEqual(percents, [(1, Decimal('0.06')), (2, Decimal('0.073'))])
+        self.assertEqual(parts(Decimal(100), [percents[1][1]], 18), [Decimal('7.3')])
@@ -0,0 +1,64 @@
+"""
+Amounts in base units: integer count of the smallest units of coin
+(like wei), amount = units / 10 ** Coin.decimals. Transaction.amount_units
+is filled from Transaction.amount on save (bulk_create callers fill it by
+fill_units), so sums by one coin are done by db on integers.
+
+Conversions change only exponent of decimal, they are exact and don't
+depend on precision of current decimal context. Amount is rounded down
+to base units, as it is sent on chain.
+"""
+from decimal import MAX_EMAX, MAX_PREC, MIN_EMIN, ROUND_DOWN, Context, Decimal
+
+from django.db.models import Sum
+
+from .models import Coin
+from .registry import get_registry
+
+
+# Context of conversions, nothing is rounded but fractions of base units
+UNITS_CONTEXT = Context(prec=MAX_PREC, rounding=ROUND_DOWN,
+                        Emax=MAX_EMAX, Emin=MIN_EMIN)
+
+
+def to_units(amount, decimals: int):
+    """Amount of coin with `decimals` in base units (int)."""
+    if amount is None:
+        return None
+    if not isinstance(amount, Decimal):
+        amount = Decimal(amount)
+    return int(amount
+               .scaleb(decimals, context=UNITS_CONTEXT)
+               .to_integral_value(context=UNITS_CONTEXT))
+
+
+def from_units(units, decimals: int):
+    """Amount (Decimal with `decimals` places) from base units."""
+    if units is None:
+        return None
+    return Decimal(int(units)).scaleb(-decimals, context=UNITS_CONTEXT)
+
+
+class SumUnits(Sum):
+    """Sum of base units. SUM of SQLite raises on overflow of 64-bit
+       integers, so there units are summed by TOTAL as REAL, the same
+       way SQLite stores units beyond int64."""
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='TOTAL', **extra_context)
+
+
+def coin_decimals(coin_id: int) -> int:
+    decimals = get_registry().decimals.get(coin_id)
+    if decimals is None:
+        # Coin is created after the registry was built
+        decimals = Coin.objects.values_list('decimals', flat=True).get(pk=coin_id)
+    return decimals
+
+
+def fill_units(transactions):
+    """Set amount_units of transactions from their amounts."""
+    for transaction in transactions:
+        transaction.amount_units = to_units(transaction.amount,
+                                            coin_decimals(transaction.coin_id))
+    return transactions
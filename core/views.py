@@ -1,7 +1,7 @@
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
-from django.db.models import Max
+from django.db.models import Max, Q
 from rest_framework.status import (HTTP_400_BAD_REQUEST,
                                    HTTP_200_OK)
 from rest_framework.generics import (GenericAPIView)
@@ -9,11 +9,17 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from core.models import Address
-from ido.models import IDO, IDOParticipant, QueueUser
-from .exceptions import MetamaskWalletExistsError
-from .models import MetamaskWallet, AdminWallet, Coin, Transaction
+from ido.models import IDOParticipant, QueueUser
+from .balances import (change_admin_wallet, fill_user_reserve,
+                       move_referals_to_reserve, takeoff_user_reserve)
+from .exceptions import InsufficientFundsError, MetamaskWalletExistsError, StalePriceError
+from .models import MetamaskWallet, Transaction
+from .prices import get_fresh_price
+from .registry import get_admin_wallet, get_coin, get_coin_ido, get_main_coin
+from .rollup import delete_transactions
 from .serializers import (CustomTokenSerializer, MetamaskWalletSerializer, UserReserveSerializer)
 from .services import get_main_wallet, referal_by_income
+from .shards import wallet_balance
 
 
 User = get_user_model()
@@ -52,6 +58,9 @@ class AddMetamaskWalletView(GenericAPIView):
                 old_address = existed_metamask.wallet_address
                 existed_metamask.wallet_address = address
                 existed_metamask.save()
+                # Transactions of address are deleted with it by cascade
+                delete_transactions(Transaction.objects.filter(
+                    Q(address_from=old_address) | Q(address_to=old_address)))
                 old_address.delete()
                 return Response({'status': 'changed'})
 
@@ -87,7 +96,8 @@ class RetrieveAdminWalletView(GenericAPIView):
     def get(self, request):
         try:
             admin_wallet = get_main_wallet()
-            return Response({'wallet_address': admin_wallet.wallet_address.address})
+            return Response({'wallet_address': admin_wallet.wallet_address.address,
+                             'balance': wallet_balance(admin_wallet)})
 
         except Exception as e:
             print(e)
@@ -124,23 +134,11 @@ class FillUserReserveView(GenericAPIView):
                     {'error': 'Не существует кошелька главного аккаунта.'},
                     status=HTTP_400_BAD_REQUEST)
 
-            coin, _ = Coin.objects.get_or_create(name='BUSD', network='BEP20')
+            coin = get_main_coin()
             amount = Decimal(serializer.validated_data['amount'])
 
-            transaction = Transaction.objects.create(
-                address_from=wallet_address_from,
-                address_to=admin_wallet.wallet_address,
-                coin=coin,
-                amount=amount,
-                fill_up=True
-                )
-
-            user.balance += transaction.amount
-            user.save()
-
-
-            admin_wallet.balance += transaction.amount
-            admin_wallet.save()
+            fill_user_reserve(user, wallet_address_from, admin_wallet,
+                              coin, amount)
 
             return Response({'status': 'success'})
 
@@ -181,46 +179,14 @@ class TakeOffUserReserveView(GenericAPIView):
                     {'error': 'У пользователя не привязан кошелек Metamask.'},
                     status=HTTP_400_BAD_REQUEST)
 
-            coin, _ = Coin.objects.get_or_create(name='BUSD', network='BEP20')
+            coin = get_main_coin()
             amount = Decimal(serializer.validated_data['amount'])
-            commission = Decimal(1.0)
 
-            if user.hold:
-                if user.balance < user.hold + amount + commission:
-                    return Response(
-                    {'error': 'У пользователя не достаточно средств для снятия из-за заморозки.'},
-                    status=HTTP_400_BAD_REQUEST)
-
-            if user.balance < amount + commission or user.balance == commission:
-                return Response(
-                    {'error': 'У пользователя не достаточно средств для снятия.'},
-                    status=HTTP_400_BAD_REQUEST)
-
-            if admin_wallet.balance < amount + commission:
-                return Response(
-                    {'error': 'На кошельке главного аккаунта не достаточно средств.'},
-                    status=HTTP_400_BAD_REQUEST)
-
-            transaction = Transaction.objects.create(
-                address_from=admin_wallet.wallet_address,
-                address_to=wallet_address_to,
-                coin=coin,
-                amount=amount-commission,
-                received=True
-                )
-
-            transaction2 = Transaction.objects.create(
-                address_from=user_metamask.wallet_address,
-                address_to=admin_wallet.wallet_address,
-                coin=coin,
-                amount=commission,
-                commission=True
-                )
-
-            user.balance = user.balance - transaction.amount - transaction2.amount
-            user.save()
-            admin_wallet.balance = admin_wallet.balance - transaction.amount + transaction2.amount
-            admin_wallet.save()
+            try:
+                takeoff_user_reserve(user, wallet_address_to, admin_wallet,
+                                     coin, amount)
+            except InsufficientFundsError as e:
+                return Response({'error': str(e)}, status=HTTP_400_BAD_REQUEST)
 
             return Response({'status': 'success'})
 
@@ -245,13 +211,10 @@ class FillUserReserveByReferalsView(GenericAPIView):
 
             user = User.objects.get(email=request.user)
 
-            if data['amount'] > user.referal_balance:
-                return Response({"error": 'Недостаточно реферальных средств.'},
-                                status=HTTP_400_BAD_REQUEST)
-
-            user.referal_balance -= Decimal(data['amount'])
-            user.balance += Decimal(data['amount'])
-            user.save()
+            try:
+                move_referals_to_reserve(user, Decimal(data['amount']))
+            except InsufficientFundsError as e:
+                return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
 
             return Response({'status': 'success'})
 
@@ -292,40 +255,14 @@ class TakeOffUserReferalsView(GenericAPIView):
                     {'error': 'У пользователя не привязан кошелек Metamask.'},
                     status=HTTP_400_BAD_REQUEST)
 
-            coin, _ = Coin.objects.get_or_create(name='BUSD', network='BEP20')
+            coin = get_main_coin()
             amount = Decimal(serializer.validated_data['amount'])
-            commission = Decimal(1.0)
-
-            if user.referal_balance < amount + commission or user.referal_balance == commission:
-                return Response(
-                    {'error': 'У пользователя не достаточно средств для снятия.'},
-                    status=HTTP_400_BAD_REQUEST)
 
-            if admin_wallet.balance < amount + commission:
-                return Response(
-                    {'error': 'На кошельке главного аккаунта не достаточно средств.'},
-                    status=HTTP_400_BAD_REQUEST)
-
-            transaction = Transaction.objects.create(
-                address_from=admin_wallet.wallet_address,
-                address_to=wallet_address_to,
-                coin=coin,
-                amount=amount-commission,
-                received=True
-                )
-
-            transaction2 = Transaction.objects.create(
-                address_from=wallet_address_to,
-                address_to=admin_wallet.wallet_address,
-                coin=coin,
-                amount=commission,
-                commission=True
-                )
-
-            user.referal_balance = user.referal_balance - transaction.amount - transaction2.amount
-            user.save()
-            admin_wallet.balance = admin_wallet.balance - transaction.amount + transaction2.amount
-            admin_wallet.save()
+            try:
+                takeoff_user_reserve(user, wallet_address_to, admin_wallet,
+                                     coin, amount, field='referal_balance')
+            except InsufficientFundsError as e:
+                return Response({'error': str(e)}, status=HTTP_400_BAD_REQUEST)
 
             return Response({'status': 'success'})
 
@@ -349,7 +286,7 @@ class TryTakeOffIDOTokensView(GenericAPIView):
             return Response({"error": "BUSD нельзя снять данным образом."},
                             status=HTTP_400_BAD_REQUEST)
         try:
-            coin = Coin.objects.get(name=coin_name)
+            coin = get_coin(coin_name)
         except Exception:
             return Response({"error": "Такой монеты не существует."},
                             status=HTTP_400_BAD_REQUEST)
@@ -364,19 +301,19 @@ class TryTakeOffIDOTokensView(GenericAPIView):
                                                       coin=coin,
                                                       received=False)
             if transactions:
-                ido = IDO.objects.get(coin=coin)
+                ido = get_coin_ido(coin)
                 ido_participant = IDOParticipant.objects.get(user=user, ido=ido)
 
-                admin_address = Address.objects.get(coin=coin, owner_admin=True)
-                admin_wallet = AdminWallet.objects.get(wallet_address=admin_address)
+                admin_wallet = get_admin_wallet(coin)
 
-                income_in_busd = sum(trans.amount for trans in transactions) * coin.cost_in_busd
+                cost = get_fresh_price(coin)
+                income_in_busd = sum(trans.amount for trans in transactions) * cost
                 income_tokens = sum(trans.amount for trans in transactions)
 
                 if ido_participant.refund_allocation < 650:
                     if Decimal(ido_participant.refund_allocation) + income_in_busd >= 650:
                         diff_busd = Decimal(ido_participant.refund_allocation) + income_in_busd - Decimal(650)
-                        diff_tokens = diff_busd / coin.cost_in_busd
+                        diff_tokens = diff_busd / cost
 
                         ido_participant.refund_allocation = 650
                         ido_participant.save()
@@ -408,6 +345,8 @@ class TryTakeOffIDOTokensView(GenericAPIView):
 
             return Response({"error": 'Отсутствуют транзакции.'},
                             status=HTTP_400_BAD_REQUEST)
+        except StalePriceError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(e)
             return Response({"error": 'Ошибка привязки адреса кошелька.'},
@@ -429,7 +368,7 @@ class TakeOffIDOTokensSuccessView(GenericAPIView):
             return Response({"error": "BUSD нельзя снять данным образом."},
                             status=HTTP_400_BAD_REQUEST)
         try:
-            coin = Coin.objects.get(name=coin_name)
+            coin = get_coin(coin_name)
         except Exception:
             return Response({"error": "Такой монеты не существует."},
                             status=HTTP_400_BAD_REQUEST)
@@ -444,13 +383,13 @@ class TakeOffIDOTokensSuccessView(GenericAPIView):
                                                       coin=coin,
                                                       received=False)
             if transactions:
-                ido = IDO.objects.get(coin=coin)
+                ido = get_coin_ido(coin)
                 ido_participant = IDOParticipant.objects.get(user=user, ido=ido)
 
-                admin_address = Address.objects.get(coin=coin, owner_admin=True)
-                admin_wallet = AdminWallet.objects.get(wallet_address=admin_address)
+                admin_wallet = get_admin_wallet(coin)
 
-                income_in_busd = sum(trans.amount for trans in transactions) * coin.cost_in_busd
+                cost = get_fresh_price(coin)
+                income_in_busd = sum(trans.amount for trans in transactions) * cost
                 income_tokens = sum(trans.amount for trans in transactions)
 
                 for trans in transactions:
@@ -462,13 +401,14 @@ class TakeOffIDOTokensSuccessView(GenericAPIView):
                     ido_participant.refund_allocation = 650
                 ido_participant.save()
 
-                admin_wallet.balance -= income_tokens
-                admin_wallet.save()
+                change_admin_wallet(admin_wallet, -income_tokens)
 
                 return Response({'status': 'success'})
 
             return Response({"error": 'Отсутствуют транзакции.'},
                             status=HTTP_400_BAD_REQUEST)
+        except StalePriceError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(e)
             return Response({"error": 'Ошибка привязки адреса кошелька.'},
@@ -36,4 +36,10 @@ class AllocationError(IDOError):
 class ManuallyChargeError(IDOError):
     def __init__(self, error) -> None:
         self.error = error
-        super().__init__(error)
\ No newline at end of file
+        super().__init__(error)
+
+
+class QueueError(IDOError):
+    def __init__(self, error) -> None:
+        self.error = error
+        super().__init__(error)
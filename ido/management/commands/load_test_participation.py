@@ -0,0 +1,182 @@
+import statistics
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.management.databases import add_live_db_argument, benchmark_database
+from core.models import Address, AdminWallet, Coin, MetamaskWallet, Transaction
+from core.rollup import delete_transactions
+from ido.exceptions import AllocationError
+from ido.models import IDO, IDOParticipant, QueueUser
+from ido.participation import participate
+
+
+User = get_user_model()
+
+PREFIX = 'loadtest-'
+
+
+class Command(BaseCommand):
+    help = ('Run parallel participations in one IDO and check that '
+            'its allocation is not oversubscribed '
+            '(on a temporary database unless --live-db is given)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200,
+                            help='Count of users participating at once')
+        parser.add_argument('--repeat', type=int, default=2,
+                            help='Parallel requests of every user')
+        parser.add_argument('--slots', type=int, default=50,
+                            help='Count of person allocations in IDO')
+        parser.add_argument('--allocation', type=float, default=100.0)
+        parser.add_argument('--retries', type=int, default=20,
+                            help='Retries of request on database lock errors')
+        parser.add_argument('--keep', action='store_true',
+                            help="Don't delete seeded data")
+        add_live_db_argument(parser)
+
+    def seed(self, options) -> dict:
+        busd, _ = Coin.objects.get_or_create(name='BUSD', network='BEP20')
+        created = {'users': [], 'addresses': [], 'coins': []}
+        if not AdminWallet.objects.filter(wallet_address__owner_admin=True,
+                                          wallet_address__coin=busd).exists():
+            admin = Address.objects.create(address=f'{PREFIX}admin', coin=busd,
+                                           owner_admin=True)
+            AdminWallet.objects.create(wallet_address=admin)
+            created['addresses'].append(admin.pk)
+
+        coin = Coin.objects.create(name='LTST', network=f'{PREFIX}network')
+        created['coins'].append(coin.pk)
+        smartcontract = Address.objects.create(address=f'{PREFIX}smartcontract',
+                                               coin=coin)
+        created['addresses'].append(smartcontract.pk)
+        now = timezone.now()
+        ido = IDO.objects.create(name=f'{PREFIX}ido', description='Load test',
+                                 general_allocation=options['slots'] * options['allocation'],
+                                 person_allocation=options['allocation'],
+                                 buy_date=now, tge=now + timedelta(days=1),
+                                 vesting='-', coin=coin, smartcontract=smartcontract,
+                                 commission=0)
+
+        inviter = User.objects.create(email=f'{PREFIX}inviter@example.com')
+        users = [inviter]
+        for i in range(options['clients']):
+            users.append(User.objects.create(
+                            email=f'{PREFIX}{i}@example.com',
+                            balance=10 * options['allocation'] + 1000,
+                            # half of users are invited, hold of some covers allocation
+                            inviter=inviter if i % 2 else None,
+                            hold=options['allocation'] if i % 5 == 0 else 0))
+        created['users'] = [user.pk for user in users]
+
+        addresses = Address.objects.bulk_create(
+                        [Address(address=f'{PREFIX}{user.pk}', coin=busd)
+                         for user in users])
+        created['addresses'].extend(address.pk for address in addresses)
+        MetamaskWallet.objects.bulk_create(
+            [MetamaskWallet(user=user, wallet_address=address)
+             for user, address in zip(users, addresses)])
+        # All users have places allowing participation, so only allocation
+        # limits them
+        QueueUser.objects.bulk_create([QueueUser(user=user, ido=ido, number=1)
+                                       for user in users[1:]])
+        return {'ido': ido, 'users': users[1:], 'inviter': inviter,
+                'created': created}
+
+    def run_clients(self, ctx: dict, options) -> list:
+        requests = [user for user in ctx['users'] for _ in range(options['repeat'])]
+        barrier = threading.Barrier(len(requests))
+        results = [None] * len(requests)
+
+        def client(index, user):
+            close_old_connections()
+            try:
+                barrier.wait()
+                started = time.perf_counter()
+                for attempt in range(options['retries'] + 1):
+                    try:
+                        participate(user, ctx['ido'])
+                        outcome = 'success'
+                    except AllocationError as e:
+                        outcome = str(e)
+                    except OperationalError as e:
+                        if attempt < options['retries']:
+                            time.sleep(0.01 * (attempt + 1))
+                            continue
+                        outcome = f'db error: {e}'
+                    break
+                results[index] = (outcome, time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(i, user))
+                   for i, user in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def find_problems(self, ctx: dict, options) -> list:
+        ido = IDO.objects.get(pk=ctx['ido'].pk)
+        participants = IDOParticipant.objects.filter(ido=ido)
+        allocated = participants.aggregate(total=Sum('allocation'))['total'] or 0
+        count = participants.count()
+        expected = min(options['slots'], options['clients'])
+        charged = User.objects.filter(pk__in=[user.pk for user in ctx['users']],
+                                      balance__lt=10 * options['allocation'] + 1000)
+
+        problems = []
+        if allocated > ido.general_allocation:
+            problems.append(f'oversubscribed: {allocated} > {ido.general_allocation}')
+        if ido.allocated != allocated:
+            problems.append(f'counter {ido.allocated} != participants sum {allocated}')
+        if count != expected:
+            problems.append(f'{count} participants instead of {expected}')
+        if charged.count() != count:
+            problems.append(f'{charged.count()} users charged for {count} participants')
+        return problems
+
+    def cleanup(self, ctx: dict):
+        created = ctx['created']
+        delete_transactions(Transaction.objects.filter(address_from__in=created['addresses']))
+        IDO.objects.filter(pk=ctx['ido'].pk).delete()
+        User.objects.filter(pk__in=created['users']).delete()
+        Address.objects.filter(pk__in=created['addresses']).delete()
+        Coin.objects.filter(pk__in=created['coins']).delete()
+
+    def handle(self, *args, **options):
+        with benchmark_database(options['live_db']):
+            self.run(options)
+
+    def run(self, options):
+        ctx = self.seed(options)
+        try:
+            started = time.perf_counter()
+            results = self.run_clients(ctx, options)
+            elapsed = time.perf_counter() - started
+            problems = self.find_problems(ctx, options)
+        finally:
+            if not options['keep']:
+                self.cleanup(ctx)
+
+        outcomes = Counter(outcome for outcome, _ in results)
+        timings = sorted(timing for _, timing in results)
+        print(f'{len(results)} requests of {options["clients"]} users '
+              f'for {options["slots"]} allocations in {elapsed:.2f}s')
+        for outcome, count in outcomes.most_common():
+            print(f'{count:8} {outcome}')
+        print(f'latency, ms: median {statistics.median(timings) * 1000:.1f}, '
+              f'max {timings[-1] * 1000:.1f}')
+
+        if problems:
+            raise CommandError('\n'.join(f'FAIL: {problem}' for problem in problems))
+        print('OK: allocation is not oversubscribed, '
+              'every participant is charged once')
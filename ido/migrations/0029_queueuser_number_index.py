@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ido', '0028_alter_ido_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='queueuser',
+            index=models.Index(fields=['ido', 'number'], name='ido_queueus_ido_id_a7507a_idx'),
+        ),
+    ]
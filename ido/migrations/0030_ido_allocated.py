@@ -0,0 +1,34 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_allocated(apps, schema_editor):
+    IDO = apps.get_model('ido', 'IDO')
+    IDOParticipant = apps.get_model('ido', 'IDOParticipant')
+
+    allocated = (IDOParticipant.objects
+                 .filter(ido=OuterRef('pk'))
+                 .order_by()
+                 .values('ido')
+                 .annotate(allocated=Sum('allocation'))
+                 .values('allocated'))
+    IDO.objects.update(allocated=Coalesce(Subquery(allocated), Value(0.0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ido', '0029_queueuser_number_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ido',
+            name='allocated',
+            field=models.FloatField(default=0.0, editable=False, verbose_name='Allocated'),
+        ),
+        migrations.RunPython(fill_allocated, migrations.RunPython.noop),
+    ]
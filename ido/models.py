@@ -14,6 +14,7 @@ class IDO(models.Model):
         - description IDO: str
         - general_allocation: float (all money)
         - person_allocation: float (money that user can invest)
+        - allocated: float (sum of participants allocations)
         - buy_date: datetime
         - tge: datetime (token generating event)
         - vesting: datetime (where tokens take effect)
@@ -35,6 +36,9 @@ class IDO(models.Model):
     description = models.TextField(verbose_name='Description IDO')
     general_allocation = models.FloatField(verbose_name='General allocation')
     person_allocation = models.FloatField(verbose_name='Person allocation')
+    # Sum of participants allocations, changed by ido.participation
+    allocated = models.FloatField(default=0.0, editable=False,
+                                  verbose_name='Allocated')
     buy_date = models.DateTimeField(verbose_name='Buy date')
     tge = models.DateTimeField(verbose_name='Token Generating Event')
     vesting = models.CharField(max_length=128, verbose_name='Vesting')
@@ -124,3 +128,4 @@ class QueueUser(models.Model):
 
     class Meta:
         unique_together = ('ido', 'user')
+        indexes = [models.Index(fields=['ido', 'number'])]
@@ -0,0 +1,146 @@
+"""
+Participation of users in IDO. Allocation of IDO is reserved by
+conditional UPDATE of IDO.allocated counter, balance of user is changed
+under row lock, and participant, referal and commission are written in
+one transaction, so parallel requests can't oversubscribe IDO or spend
+balance of user twice.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from administrator.services import invalidate_admin_stats
+from core.models import MetamaskWallet, Transaction
+from core.registry import get_main_coin
+from core.services import get_main_wallet
+
+from .exceptions import AllocationError
+from .models import IDO, IDOParticipant, QueueUser
+
+
+User = get_user_model()
+
+# User pays allocation and 30% over it, 5% of allocation (not covered
+# by hold) go to inviter, the rest of the 30% is commission of platform
+PAYMENT_RATE = Decimal('1.3')
+COMMISSION_RATE = Decimal('0.3')
+REFERAL_RATE = Decimal('0.05')
+
+MIN_BALANCE = 651
+
+
+def refresh_allocated(ido):
+    """Recount allocated sum of IDO from its participants
+       (after participants were changed by admin)."""
+    allocated = (IDOParticipant.objects
+                 .filter(ido=OuterRef('pk'))
+                 .order_by()
+                 .values('ido')
+                 .annotate(allocated=Sum('allocation'))
+                 .values('allocated'))
+    IDO.objects.filter(pk=ido.pk).update(
+        allocated=Coalesce(Subquery(allocated), Value(0.0)))
+
+
+def reserve_allocation(ido, allocation: float) -> bool:
+    """Increase allocated sum of IDO if it doesn't exceed general
+       allocation. Returns False if allocation is distributed."""
+    return bool(IDO.objects
+                .filter(pk=ido.pk,
+                        allocated__lte=F('general_allocation') - allocation)
+                .update(allocated=F('allocated') + allocation))
+
+
+def check_balance(user, allocation: float):
+    if user.balance < MIN_BALANCE \
+            or user.balance < PAYMENT_RATE * Decimal(str(allocation)) + 1:
+        raise AllocationError('У пользователя недостаточно средств на счете.')
+
+
+def check_queue_place(user, ido):
+    number = (QueueUser.objects
+              .filter(ido=ido, user=user)
+              .values_list('number', flat=True)
+              .first())
+    if number is None:
+        raise AllocationError('Вы не находитесь в очереди на участие в IDO.')
+    if number > ido.count_participants:
+        raise AllocationError(
+            'Место в очереди не позволяет Вам участововать в данном IDO.')
+
+
+def _referal(user, allocation: Decimal) -> Decimal:
+    """Referal of inviter, hold of user covers allocation first."""
+    if not user.hold:
+        return allocation * REFERAL_RATE
+    if allocation > user.hold:
+        referal = (allocation - user.hold) * REFERAL_RATE
+        user.hold = Decimal(0)
+    else:
+        referal = Decimal(0)
+        user.hold -= allocation
+    return referal
+
+
+def _pay(user, allocation: Decimal, referal: Decimal):
+    """Referal to inviter and commission to admin wallet."""
+    if not referal:
+        return
+
+    busd = get_main_coin()
+    wallets = dict(MetamaskWallet.objects
+                   .filter(user_id__in=[user.pk, user.inviter_id])
+                   .values_list('user_id', 'wallet_address'))
+    commission = allocation * COMMISSION_RATE
+
+    if user.inviter_id:
+        Transaction.objects.create(address_from_id=wallets[user.pk],
+                                   address_to_id=wallets[user.inviter_id],
+                                   coin=busd,
+                                   amount=referal,
+                                   referal=True)
+        (User.objects
+         .filter(pk=user.inviter_id)
+         .update(referal_balance=F('referal_balance') + referal))
+        invalidate_admin_stats()
+        commission -= referal
+
+    Transaction.objects.create(address_from_id=wallets[user.pk],
+                               address_to=get_main_wallet().wallet_address,
+                               coin=busd,
+                               amount=commission,
+                               commission=True)
+
+
+def participate(user, ido) -> IDOParticipant:
+    """Participate user in IDO with person allocation: checks and all
+       writes are done in one transaction under lock of user row."""
+    allocation = Decimal(str(ido.person_allocation))
+    with transaction.atomic():
+        user = User.objects.select_for_update().get(pk=user.pk)
+        check_balance(user, ido.person_allocation)
+        check_queue_place(user, ido)
+        if IDOParticipant.objects.filter(ido=ido, user=user).exists():
+            raise AllocationError('Пользователь уже участвует в данном IDO.')
+
+        if not reserve_allocation(ido, ido.person_allocation):
+            raise AllocationError('К сожалению, вся аллокация IDO уже распределена.')
+
+        participant = IDOParticipant.objects.create(
+                            ido=ido, user=user,
+                            allocation=ido.person_allocation)
+
+        if user.hold:
+            user.balance -= allocation
+        else:
+            user.balance -= PAYMENT_RATE * allocation
+        referal = _referal(user, allocation)
+        user.can_invite = True
+        user.status = 'P'
+        user.save(update_fields=['balance', 'hold', 'can_invite', 'status'])
+
+        _pay(user, allocation, referal)
+    return participant
@@ -0,0 +1,144 @@
+"""
+Places of users in IDO queues. Place of every queue row is kept dense
+(1, 2, ...), rows below inserted one are shifted by a single UPDATE,
+after changes of permanent places queue is recomputed in one pass.
+All changes of one IDO queue are done in a transaction holding row lock
+of the IDO, so concurrent joins can't take the same place.
+"""
+from collections import deque
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from .exceptions import QueueError
+from .models import IDO, QueueUser
+
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def lock_queue(ido) -> IDO:
+    """Lock IDO row until the end of current transaction, it serializes
+       all changes of IDO queue."""
+    return IDO.objects.select_for_update().get(pk=ido.pk)
+
+
+def _last_number(ido) -> int:
+    return QueueUser.objects.filter(ido=ido).aggregate(
+                number=Max('number'))['number'] or 0
+
+
+def _shift_down(ido, number: int, exclude=None):
+    """Move all rows from place `number` one place down."""
+    queues = QueueUser.objects.filter(ido=ido, number__gte=number)
+    if exclude is not None:
+        queues = queues.exclude(pk=exclude.pk)
+    queues.update(number=F('number') + 1)
+
+
+def join_queue(user, ido) -> QueueUser:
+    """Add user to the end of IDO queue or to his permanent place
+       with constant count of queries."""
+    with transaction.atomic():
+        lock_queue(ido)
+        if QueueUser.objects.filter(user=user, ido=ido).exists():
+            raise QueueError('Пользователь уже в очереди данного IDO.')
+
+        if user.permanent_place:
+            number = user.permanent_place
+            _shift_down(ido, number)
+        else:
+            number = _last_number(ido) + 1
+
+        return QueueUser.objects.create(user=user, ido=ido,
+                                        permanent=bool(user.permanent_place),
+                                        number=number)
+
+
+def _queue_order(rows: list) -> list:
+    """Order of queue rows: users with permanent place stand on it
+       (or on the nearest free place), others fill the rest of places
+       by date of joining."""
+    permanent = deque(sorted((row for row in rows if row['permanent']),
+                             key=lambda row: (row['place'], row['date'], row['id'])))
+    others = deque(sorted((row for row in rows if not row['permanent']),
+                          key=lambda row: (row['date'], row['id'])))
+    order = []
+    while permanent or others:
+        if permanent and (not others or permanent[0]['place'] <= len(order) + 1):
+            order.append(permanent.popleft())
+        else:
+            order.append(others.popleft())
+    return order
+
+
+def recompute_queue(ido_id: int) -> int:
+    """Recompute places of all rows of IDO queue by permanent places
+       of users in one pass. Returns count of moved rows."""
+    with transaction.atomic():
+        lock_queue(IDO(pk=ido_id))
+        rows = list(QueueUser.objects
+                    .filter(ido_id=ido_id)
+                    .values('id', 'number', 'date', 'permanent', 'is_active',
+                            place=F('user__permanent_place')))
+        for row in rows:
+            row['was_permanent'] = row['permanent']
+            # Flag of inactive rows is kept while user has permanent place
+            if row['is_active'] or row['place'] is None:
+                row['permanent'] = row['place'] is not None
+
+        changed = []
+        for number, row in enumerate(_queue_order(rows), start=1):
+            if row['number'] != number or row['permanent'] != row['was_permanent']:
+                changed.append(QueueUser(pk=row['id'], number=number,
+                                         permanent=row['permanent']))
+        QueueUser.objects.bulk_update(changed, ['number', 'permanent'],
+                                      batch_size=BATCH_SIZE)
+        return len(changed)
+
+
+def set_permanent_places(changes) -> list:
+    """Apply changes of permanent places [(user, place or None), ...]
+       in order: places of other users are shifted by set-based updates,
+       then queues of IDOs with affected users are recomputed once.
+       Returns ids of recomputed IDOs."""
+    with transaction.atomic():
+        touched = set()
+        for user, place in changes:
+            current = (User.objects
+                       .select_for_update()
+                       .values_list('permanent_place', flat=True)
+                       .get(pk=user.pk))
+            if not place and not current:
+                raise QueueError(f'Пользователь {user.email} не состоит '
+                                 'в приоритетной очереди.')
+            if place is not None and place < 1:
+                raise QueueError('Номер в очереди не может быть меньше 1.')
+
+            if current:
+                (User.objects
+                 .filter(permanent_place__gt=current)
+                 .update(permanent_place=F('permanent_place') - 1))
+            if place:
+                (User.objects
+                 .filter(permanent_place__gte=place)
+                 .exclude(pk=user.pk)
+                 .update(permanent_place=F('permanent_place') + 1))
+            User.objects.filter(pk=user.pk).update(permanent_place=place or None)
+            touched.update(p for p in (current, place) if p)
+            user.permanent_place = place or None
+
+        users = Q(user__in=[user for user, _ in changes])
+        if touched:
+            users |= Q(user__permanent_place__gte=min(touched))
+        ido_ids = list(QueueUser.objects
+                       .filter(users)
+                       .order_by('ido_id')
+                       .values_list('ido_id', flat=True)
+                       .distinct())
+        for ido_id in ido_ids:
+            recompute_queue(ido_id)
+    return ido_ids
@@ -11,7 +11,11 @@ from account.exceptions import EmailValidationError, UserDoesNotExists
 from core.models import MetamaskWallet, Transaction
 from ido.models import IDOParticipant
 from core.models import AdminWallet
+from core.balances import change_admin_wallet, credit_user
+from core.registry import get_main_coin
+from core.rollup import delete_transactions
 from core.services import get_main_wallet
+from ido.participation import PAYMENT_RATE
 
 
 User = get_user_model()
@@ -76,46 +80,13 @@ def process_ido_data(request_query_dict: dict):
     return data, users_obj, allocations
 
 
-def fill_admin_wallet(user, amount: Decimal):
-    admin_wallet = get_main_wallet()
-    metamask_from = MetamaskWallet.objects.get(user=user)
-    coin, _ = Coin.objects.get_or_create(name='BUSD',
-                                         network='BEP20')
-    Transaction.objects.create(
-                    address_from=metamask_from.wallet_address,
-                    address_to=admin_wallet.wallet_address,
-                    coin=coin,
-                    amount=amount,
-                    commission=True
-                    )
-
 def takeoff_admin_wallet(amount):
-    admin_wallet = get_main_wallet()
-    admin_wallet.balance -= Decimal(amount)
-    admin_wallet.save()
-
-
-def realize_ido_part_referal(user: User, referal: Decimal):
-    coin, _ = Coin.objects.get_or_create(name='BUSD',
-                                         network='BEP20')
-    metamask_from = MetamaskWallet.objects.get(user=user)
-    metamask_to = MetamaskWallet.objects.get(user=user.inviter)
-    transaction = Transaction.objects.create(
-                    address_from=metamask_from.wallet_address,
-                    address_to=metamask_to.wallet_address,
-                    coin=coin,
-                    amount=Decimal(referal),
-                    referal=True
-    )
-    user.inviter.referal_balance += transaction.amount
-    user.inviter.save()
+    change_admin_wallet(get_main_wallet(), -Decimal(amount))
 
 
 def decline_ido_part_referal(user: User, referal, date):
-    user.inviter.balance -= Decimal(referal)
-    user.inviter.save()
-    coin, _ = Coin.objects.get_or_create(name='BUSD',
-                                         network='BEP20')
+    credit_user(user.inviter, -Decimal(referal))
+    coin = get_main_coin()
     metamask_from = MetamaskWallet.objects.get(user=user)
     metamask_to = MetamaskWallet.objects.get(user=user.inviter)
     for t in Transaction.objects.filter(
@@ -124,7 +95,7 @@ def decline_ido_part_referal(user: User, referal, date):
                     coin=coin):
         diff = t.date - date
         if diff.total_seconds() < 0.5:
-            t.delete()
+            delete_transactions(Transaction.objects.filter(pk=t.pk))
             break
 
 
@@ -136,37 +107,12 @@ def participate_ido(user: User, ido: IDO, allocation, wo_pay=False):
     participant.allocation = allocation
     participant.save()
     if not wo_pay:
+        amount = Decimal(str(allocation))
         if user.hold:
-            user.balance -= Decimal(allocation)
+            credit_user(user, -amount)
         else:
-            user.balance -= Decimal(1.3 * allocation)
+            credit_user(user, -PAYMENT_RATE * amount)
     user.can_invite = True
     user.status = 'P'
-    user.save()
-
+    user.save(update_fields=['can_invite', 'status'])
 
-def count_referal_hold(user: User, allocation):
-    if user.hold:
-        if allocation > user.hold:
-            referal = (Decimal(allocation) - user.hold) * Decimal(0.05)
-            user.hold = Decimal(0)
-        else:
-            referal = Decimal(0)
-            user.hold -= Decimal(allocation)
-    else:
-        referal = Decimal(allocation) * Decimal(0.05)
-
-    user.save()
-    return referal
-
-
-def delete_participant(participant, allocation):
-    referal = count_referal_hold(participant.user,
-                                 allocation)
-    referal = (Decimal(allocation) - user.hold) * Decimal(0.05)
-    takeoff_admin_wallet(Decimal(allocation) * Decimal(0.3))
-    if referal and participant.user.inviter:
-        decline_ido_part_referal(participant.user,
-                                 referal, participant.date)
-    participant.user.balance += Decimal(1.3) * Decimal(allocation)
-    participant.delete()
@@ -2,7 +2,7 @@ from decimal import Decimal
 from time import sleep
 
 from django.contrib.auth import get_user_model
-from django.db.models import Max
+from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from requests import request
@@ -17,16 +17,21 @@ from rest_framework.response import Response
 from account.services import paginate
 from core.exceptions import AdminWalletIsEmptyError
 
-from core.models import AdminWallet, Coin, MetamaskWallet, Transaction, Address
+from core.models import MetamaskWallet, Transaction
+from core.balances import credit_user
+from core.distribution import pay_participants
+from core.prices import get_fresh_price
+from core.registry import get_admin_wallet
 from core.services import distribute_tokens, referal_by_income
 
-from .exceptions import ExchangeAddError, IDOExistsError, AllocationError, ManuallyChargeError
-from .models import IDO, IDOParticipant, QueueUser
+from .exceptions import ExchangeAddError, IDOExistsError, AllocationError, ManuallyChargeError, QueueError
+from .models import IDO, IDOParticipant
+from .participation import COMMISSION_RATE, PAYMENT_RATE, participate, refresh_allocated
+from .queue import join_queue
 from .serializers import (ChargeManuallySerializer, IDOSerializer, AddUserQueueSerializer,
                           ParticipateIDOSerializer, PureIDOSerializer)
-from .services import (decline_ido_part_referal, delete_participant, process_ido_data, fill_admin_wallet,
-                       realize_ido_part_referal, participate_ido, takeoff_admin_wallet,
-                       count_referal_hold)
+from .services import (decline_ido_part_referal, process_ido_data,
+                       participate_ido, takeoff_admin_wallet)
 
 User = get_user_model()
 
@@ -134,6 +139,7 @@ class IDOCreateView(CreateAPIView):
                     else:
                         for user_ in users:
                             participate_ido(user_, ido, ido.person_allocation, wo_pay=True)
+                    refresh_allocated(ido)
                 except Exception as e:
                     print(e)
                     ido.delete()
@@ -210,11 +216,14 @@ class IDOUpdateView(UpdateAPIView):
 
             else:
                 for part in IDOParticipant.objects.filter(ido=instance):
-                    part.user.hold += part.allocation
-                    part.user.balance += Decimal(1.3 * part.allocation)
-                    part.user.save()
-                    takeoff_admin_wallet(part.allocation * Decimal(0.3))
-                    part.delete()
+                    # Refund of participant is applied entirely or not at all
+                    allocation = Decimal(str(part.allocation))
+                    with transaction.atomic():
+                        credit_user(part.user, allocation, 'hold')
+                        credit_user(part.user, PAYMENT_RATE * allocation)
+                        takeoff_admin_wallet(COMMISSION_RATE * allocation)
+                        part.delete()
+            refresh_allocated(instance)
 
             return Response(serializer.data,
                             status=HTTP_200_OK)
@@ -242,9 +251,8 @@ class IDODeleteView(DestroyAPIView):
                     part.delete()
             else:
                 for part in participants:
-                    part.user.hold += Decimal(part.allocation)
-                    part.user.balance += Decimal(part.allocation)
-                    part.user.save()
+                    credit_user(part.user, Decimal(part.allocation), 'hold')
+                    credit_user(part.user, Decimal(part.allocation))
                     part.delete()
             self.perform_destroy(instance)
             return Response(status=HTTP_204_NO_CONTENT)
@@ -273,58 +281,18 @@ class ParticipateIDOView(GenericAPIView):
 
         ido = serializer.validated_data
 
-        if user.balance < 651 or float(user.balance) < 1.3 * float(ido.person_allocation) + 1.0:
-            return Response(
-                {'error': 'У пользователя недостаточно средств на счете.'},
-                status=HTTP_400_BAD_REQUEST
-                )
-
         try:
-            queue_object = QueueUser.objects.get(ido=ido, user=user)
-            if queue_object.number > ido.count_participants:
-                return Response(
-                    {'error': 'Место в очереди не позволяет Вам участововать в данном IDO.'},
-                    status=HTTP_400_BAD_REQUEST
-                )
-        except Exception:
-            return Response(
-                    {'error': 'Вы не находитесь в очереди на участие в IDO.'},
-                    status=HTTP_400_BAD_REQUEST
-                )
-
-        participants = IDOParticipant.objects.filter(ido=ido)
-        used_allocation = len(participants) * ido.person_allocation
-
-        if ido.general_allocation - used_allocation >= ido.person_allocation:
-            try:
-                participate_ido(user, ido, ido.person_allocation)
-                referal = count_referal_hold(user, ido.person_allocation)
-            except Exception as e:
-                print(e)
-                return Response(
-                    {'error': 'Ошибка при попытке участия в данном IDO.'},
-                    status=HTTP_400_BAD_REQUEST
-                )
-
-            else:
-                if float(referal): 
-                    if user.inviter:
-                        realize_ido_part_referal(user, referal)
-                        diff = Decimal(ido.person_allocation) * Decimal(0.3) - referal
-                        fill_admin_wallet(user, diff)
-                    else:
-                        fill_admin_wallet(user, Decimal(ido.person_allocation) * Decimal(0.3))
-
-                return Response({'status': 'success'})
-
-        else:
+            participate(user, ido)
+        except AllocationError as e:
+            return Response({'error': str(e)}, status=HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            print(e)
             return Response(
-                    {'error': 'К сожалению, вся аллокация IDO уже распределена.'},
-                    status=HTTP_400_BAD_REQUEST
-                )
+                {'error': 'Ошибка при попытке участия в данном IDO.'},
+                status=HTTP_400_BAD_REQUEST
+            )
 
-        # except Exception as e:
-        #     return Response({'error': str(e)}, status=HTTP_400_BAD_REQUEST)
+        return Response({'status': 'success'})
 
 
 class AddUserQueue(GenericAPIView):
@@ -356,36 +324,9 @@ class AddUserQueue(GenericAPIView):
                     )
 
             try:
-                QueueUser.objects.get(user=user, ido=ido)
-                return Response(
-                    {'error': 'Пользователь уже в очереди данного IDO.'},
-                    status=HTTP_400_BAD_REQUEST
-                    )
-            except:
-                pass
-
-            if user.permanent_place:
-                permanent = True
-                number = user.permanent_place
-            else:
-                permanent = False
-                all_queues = QueueUser.objects.filter(ido=ido)
-                if not all_queues:
-                    number = 1
-                else:
-                    number = all_queues.aggregate(Max('number'))['number__max'] + 1
-
-            try:
-                queues = QueueUser.objects.filter(ido=ido, number__gte=number)
-                if queues:
-                    for q in queues:
-                        q.number += 1
-                        q.save()
-                QueueUser.objects.create(user=user,
-                                         ido=ido,
-                                         permanent=permanent,
-                                         number=number)
-
+                join_queue(user, ido)
+            except QueueError as e:
+                return Response({'error': str(e)}, status=HTTP_400_BAD_REQUEST)
             except Exception as e:
                 print(e)
                 return Response(
@@ -425,7 +366,7 @@ class ChargeTokensManuallyView(GenericAPIView):
 
         try:
             busd_amount, ido = serializer.validated_data
-            amount = Decimal(busd_amount)/ido.coin.cost_in_busd
+            amount = Decimal(busd_amount)/get_fresh_price(ido.coin)
 
             if not ido.smartcontract:
                 return Response(
@@ -438,28 +379,12 @@ class ChargeTokensManuallyView(GenericAPIView):
                     status=HTTP_400_BAD_REQUEST
                     )
 
-            address = Address.objects.get(coin=ido.coin,
-                                          owner_admin=True)
-
-            admin_wallet = AdminWallet.objects.get(wallet_address=address)
+            admin_wallet = get_admin_wallet(ido.coin_id)
 
             ido_participants = IDOParticipant.objects.filter(ido=ido)
             if ido_participants:
-                for part in ido_participants:
-                        amount_user = referal_by_income(
-                            user=part.user,
-                            admin_wallet=admin_wallet,
-                            smartcontract=ido.smartcontract,
-                            tokens=amount)
-
-                        part_metamask = MetamaskWallet.objects.get(user=part.user)
-
-                        Transaction.objects.create(
-                            address_from=ido.smartcontract,
-                            address_to=part_metamask.wallet_address,
-                            coin=admin_wallet.wallet_address.coin,
-                            amount=amount_user
-                            )
+                pay_participants(admin_wallet, ido.smartcontract,
+                                 [(part, amount) for part in ido_participants])
 
             return Response({'status': 'success'})
 